@@ -0,0 +1,52 @@
+"""Measures get_tasks_between and get_stale_tasks latency on a large database.
+
+Run with: python benchmarks/bench_date_queries.py [users]
+Uses a temporary synthetic database of users * 100 worklists * 100 tasks (default 1000 users, 10M tasks,
+a couple of minutes to generate). The target is a few milliseconds per query, the biggest user included.
+"""
+import pathlib
+import statistics
+import sys
+import tempfile
+import time
+from datetime import date
+
+from sqlalchemy import text
+
+from todolist import db
+from todolist.fake_data import END_DATE, generate_fake_data
+
+
+def main():
+    users = int(sys.argv[1]) if len(sys.argv) > 1 else 1000
+    with tempfile.TemporaryDirectory() as folder:
+        db.configure(db_path=pathlib.Path(folder) / "dates.db", profile="fast")
+        db.SQLModel.metadata.create_all(db.engine)
+        start = time.perf_counter()
+        tasks = generate_fake_data(users, 100, 100, seed=0)
+        print(f"loaded {tasks} tasks in {time.perf_counter() - start:.1f}s")
+        with db.engine.connect() as connection:
+            biggest = connection.execute(text(
+                "SELECT user_id FROM worklist GROUP BY user_id ORDER BY count(*) DESC LIMIT 1")).scalar_one()
+        # the synthetic data ends on END_DATE, stale is counted from today
+        stale_days = (date.today() - END_DATE).days + 30
+        queries = {
+            "between, last week of user 1": lambda: db.get_tasks_between(1, date(2024, 12, 24), END_DATE),
+            "between, a month of the biggest user": lambda: db.get_tasks_between(biggest, date(2024, 1, 1), date(2024, 1, 31)),
+            "until, oldest of the biggest user": lambda: db.get_tasks_between(biggest, None, date(2022, 6, 1)),
+            "stale, every user": lambda: db.get_stale_tasks(stale_days),
+            "stale, the biggest user": lambda: db.get_stale_tasks(stale_days, user_id=biggest),
+        }
+        for name, query in queries.items():
+            timings = []
+            for _ in range(20):
+                start = time.perf_counter()
+                results = query()
+                timings.append(time.perf_counter() - start)
+            print(f"{name:<40} {len(results):>3} tasks  median {statistics.median(timings) * 1000:7.2f} ms"
+                  f"  max {max(timings) * 1000:7.2f} ms")
+        db.engine.dispose()
+
+
+if __name__ == "__main__":
+    main()
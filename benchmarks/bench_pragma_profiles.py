@@ -0,0 +1,52 @@
+"""Compares the sqlite pragma profiles of todolist.db (see PRAGMA_PROFILES).
+
+Run with: python benchmarks/bench_pragma_profiles.py [n_tasks]
+Each profile gets its own temporary database file.
+"""
+import sys
+import tempfile
+import time
+import pathlib
+
+from todolist import db
+
+
+def bench_profile(profile: str, folder: pathlib.Path, n_tasks: int) -> dict:
+    db.configure(db_path=folder / f"{profile}.db", profile=profile)
+    db.create_db_and_tables()
+    worklist_id = db.get_worklists(1)[0].id
+
+    start = time.perf_counter()
+    for i in range(n_tasks):
+        db.create_task(f"task {i}", worklist_id=worklist_id)
+    per_row = time.perf_counter() - start
+
+    start = time.perf_counter()
+    db.create_tasks_bulk((f"bulk task {i}" for i in range(n_tasks * 100)), worklist_id=worklist_id)
+    bulk = time.perf_counter() - start
+
+    start = time.perf_counter()
+    for _ in range(20):
+        db.get_tasks(worklist_id)
+    read = (time.perf_counter() - start) / 20
+
+    return {
+        "create_task (rows/s)": n_tasks / per_row,
+        "create_tasks_bulk (rows/s)": n_tasks * 100 / bulk,
+        "get_tasks (ms)": read * 1000,
+    }
+
+
+def main():
+    n_tasks = int(sys.argv[1]) if len(sys.argv) > 1 else 500
+    with tempfile.TemporaryDirectory() as folder:
+        results = {profile: bench_profile(profile, pathlib.Path(folder), n_tasks) for profile in db.PRAGMA_PROFILES}
+        db.engine.dispose()
+    metrics = list(next(iter(results.values())))
+    print(f"{'metric':<30}" + "".join(f"{profile:>12}" for profile in results))
+    for metric in metrics:
+        print(f"{metric:<30}" + "".join(f"{results[profile][metric]:>12.1f}" for profile in results))
+
+
+if __name__ == "__main__":
+    main()
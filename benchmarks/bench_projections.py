@@ -0,0 +1,49 @@
+"""Compares loading a worklist as full Task objects (get_tasks) against TaskRow projections (get_task_rows).
+
+Run with: python benchmarks/bench_projections.py [n_tasks]
+Uses a temporary database with one worklist of n_tasks tasks (default 100k).
+"""
+import gc
+import sys
+import tempfile
+import time
+import pathlib
+import tracemalloc
+
+from todolist import db
+
+
+def measure(load, worklist_id: int) -> dict:
+    gc.collect()
+    start = time.perf_counter()
+    items = load(worklist_id)
+    seconds = time.perf_counter() - start
+    del items
+    gc.collect()
+    # a second run under tracemalloc for the memory, tracing slows down the timing
+    tracemalloc.start()
+    items = load(worklist_id)
+    memory, _ = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return {"rows/s": len(items) / seconds, "MB": memory / 1e6}
+
+
+def main():
+    n_tasks = int(sys.argv[1]) if len(sys.argv) > 1 else 100_000
+    with tempfile.TemporaryDirectory() as folder:
+        db.configure(db_path=pathlib.Path(folder) / "projections.db")
+        db.create_db_and_tables()
+        worklist_id = db.get_worklists(1)[0].id
+        db.create_tasks_bulk((f"task {i}" for i in range(n_tasks)), worklist_id=worklist_id)
+        results = {
+            "get_tasks": measure(db.get_tasks, worklist_id),
+            "get_task_rows": measure(db.get_task_rows, worklist_id),
+        }
+        db.engine.dispose()
+    print(f"{n_tasks} tasks")
+    for name, result in results.items():
+        print(f"{name:<15} {result['rows/s']:>12.0f} rows/s {result['MB']:>8.1f} MB")
+
+
+if __name__ == "__main__":
+    main()
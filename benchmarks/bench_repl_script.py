@@ -0,0 +1,49 @@
+"""Measures todo-repl --script throughput, commands per second.
+
+Run with: python benchmarks/bench_repl_script.py [n_commands] [repeats]
+A temporary database with one user and a worklist of 20 tasks runs a script of n_commands
+(default 3000) 'complete 1' lines, each command in its own transaction and then with --atomic.
+The best and the median of repeats runs (default 3) are shown.
+"""
+import contextlib
+import os
+import pathlib
+import statistics
+import sys
+import tempfile
+import time
+
+from todolist import db
+from todolist.repl.app import AppState, run_script
+
+
+def commands_per_second(lines: list, atomic: bool) -> float:
+    state = AppState()
+    start = time.perf_counter()
+    # the lines of the commands go nowhere, the summary on stderr is not wanted either
+    with open(os.devnull, "w") as devnull, contextlib.redirect_stdout(devnull), contextlib.redirect_stderr(devnull):
+        run_script(state, lines, atomic=atomic)
+    seconds = time.perf_counter() - start
+    state.repo.close()
+    return len(lines) / seconds
+
+
+def main():
+    n_commands = int(sys.argv[1]) if len(sys.argv) > 1 else 3000
+    repeats = int(sys.argv[2]) if len(sys.argv) > 2 else 3
+    with tempfile.TemporaryDirectory() as folder:
+        db.configure(db_path=pathlib.Path(folder) / "script.db")
+        db.SQLModel.metadata.create_all(db.engine)
+        db.create_user("Ada", "Lovelace")
+        db.create_worklist("Errands", user_id=1)
+        db.create_tasks_bulk([f"task {number}" for number in range(20)], worklist_id=1)
+        lines = ["select 1", "select 1"] + ["complete 1"] * n_commands
+        for atomic in (False, True):
+            rates = [commands_per_second(lines, atomic) for _ in range(repeats)]
+            print(f"{'--atomic' if atomic else 'default':<10} best {max(rates):>7,.0f} commands/s  "
+                  f"median {statistics.median(rates):>7,.0f} commands/s")
+        db.engine.dispose()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,62 @@
+"""Measures search_tasks latency on a large database.
+
+Run with: python benchmarks/bench_search.py [n_tasks] [n_users]
+Uses a temporary database with n_tasks tasks (default 1M) spread over 100 worklists, which belong
+to n_users users (default 100). The searches are the ones of the first of them. n_users=1, where every task
+matches the user, is the worst case.
+The target is a median under 10 ms per search on 1M tasks.
+"""
+import random
+import statistics
+import sys
+import tempfile
+import time
+from itertools import accumulate
+import pathlib
+
+from todolist import db
+
+COMMON_WORDS = ["buy", "milk", "eggs", "call", "mom", "fix", "bug", "write", "report", "clean", "kitchen",
+                "book", "flight", "pay", "rent", "water", "plants", "email", "boss", "gym", "read", "paper"]
+QUERIES = ["milk", "fix bug", "pay re", "kitchen plants email", "qu", "zzz"]
+
+
+def make_vocabulary(rng: random.Random, size: int = 20_000) -> list:
+    letters = "abcdefghijklmnopqrstuvwxyz"
+    return COMMON_WORDS + ["".join(rng.choices(letters, k=rng.randint(3, 9))) for _ in range(size)]
+
+
+def fake_tasks(n_tasks: int, worklist_ids: list):
+    rng = random.Random(0)
+    vocabulary = make_vocabulary(rng)
+    # word frequencies follow Zipf's law like real text: a few words are everywhere, most are rare
+    cum_weights = list(accumulate(1 / rank for rank in range(1, len(vocabulary) + 1)))
+    for i in range(n_tasks):
+        words = rng.choices(vocabulary, cum_weights=cum_weights, k=rng.randint(2, 8))
+        yield dict(task=" ".join(words), worklist_id=rng.choice(worklist_ids))
+
+
+def main():
+    n_tasks = int(sys.argv[1]) if len(sys.argv) > 1 else 1_000_000
+    n_users = int(sys.argv[2]) if len(sys.argv) > 2 else 100
+    with tempfile.TemporaryDirectory() as folder:
+        db.configure(db_path=pathlib.Path(folder) / "search.db", profile="fast")
+        db.create_db_and_tables()
+        user_ids = [db.create_user(f"user {i}", "Test").id for i in range(n_users)]
+        worklist_ids = db.create_worklists_bulk(dict(name=f"list {i}", user_id=user_ids[i % n_users]) for i in range(100))
+        start = time.perf_counter()
+        db.create_tasks_bulk(fake_tasks(n_tasks, worklist_ids))
+        print(f"loaded {n_tasks} tasks of {n_users} users in {time.perf_counter() - start:.1f}s")
+        for query in QUERIES:
+            timings = []
+            for _ in range(20):
+                start = time.perf_counter()
+                results = db.search_tasks(user_ids[0], query, limit=20)
+                timings.append(time.perf_counter() - start)
+            print(f"{query!r:<25} {len(results):>3} results  median {statistics.median(timings) * 1000:7.2f} ms"
+                  f"  max {max(timings) * 1000:7.2f} ms")
+        db.engine.dispose()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,270 @@
+"""The benchmark suite: the db layer, the repl and the tui on synthetic databases of several sizes.
+
+Run with: python benchmarks/bench_suite.py [--sizes small,medium] [--output results.json] [--compare old.json]
+
+Every size gets a temporary database made with todolist.fake_data (same seed every run), then:
+- reads: get_users / get_worklists / get_tasks latency (get_tasks on a typical and on the biggest worklist)
+- writes: create_task / update_entity / delete_entity throughput, each call its own transaction
+- repl: execute_command round trip (table drawn to /dev/null), driven without a terminal
+- tui: time until the first worklist's tasks are shown, and switching to the next worklist
+
+The results are written as JSON. With --compare, every number is also shown next to the one in an
+older results file, to spot regressions between commits.
+"""
+import asyncio
+import json
+import os
+import pathlib
+import platform
+import sqlite3
+import statistics
+import subprocess
+import tempfile
+import time
+from datetime import datetime
+
+import click
+from sqlalchemy import text
+
+from todolist import db
+from todolist.fake_data import generate_fake_data
+
+# users, worklists per user, tasks per worklist
+SIZES = {
+    "small": (10, 10, 20),          # 2k tasks
+    "medium": (100, 20, 100),       # 200k tasks
+    "large": (1000, 100, 100),      # 10M tasks, a couple of minutes to generate
+}
+READ_REPEATS = 20
+WRITE_OPS = 200
+REPL_REPEATS = 20
+TUI_SWITCHES = 20 # the same number whatever the size, the small sizes revisit worklists
+REGRESSION = 20 # percent slower than the older results that gets marked. Sub-millisecond numbers are noisy
+TUI_TIMEOUT = 30 # seconds, a load that never finishes fails the run instead of hanging it
+
+
+def latency(fn, repeats: int = READ_REPEATS) -> dict:
+    timings = []
+    for _ in range(repeats):
+        start = time.perf_counter()
+        fn()
+        timings.append(time.perf_counter() - start)
+    return summary(timings)
+
+
+def summary(timings: list) -> dict:
+    timings = sorted(timings)
+    return {
+        "median_ms": statistics.median(timings) * 1000,
+        "p95_ms": timings[min(len(timings) - 1, int(len(timings) * 0.95))] * 1000,
+        "min_ms": timings[0] * 1000,
+        "n": len(timings),
+    }
+
+
+def throughput(fn, ops: int = WRITE_OPS) -> dict:
+    start = time.perf_counter()
+    for i in range(ops):
+        fn(i)
+    seconds = time.perf_counter() - start
+    return {"ops_per_s": ops / seconds, "mean_ms": seconds / ops * 1000, "n": ops}
+
+
+def pick_worklists(user_id: int):
+    """A worklist of user_id with a typical number of tasks, and the biggest worklist of all"""
+    with db.engine.connect() as connection:
+        sizes = connection.execute(text(
+            "SELECT worklist.id, count(task.id) FROM worklist LEFT JOIN task ON task.worklist_id = worklist.id "
+            "WHERE worklist.user_id = :user_id GROUP BY worklist.id ORDER BY 2"), dict(user_id=user_id)).all()
+        biggest = connection.execute(text(
+            "SELECT worklist_id, count(*) FROM task GROUP BY worklist_id ORDER BY 2 DESC LIMIT 1")).one()
+    return sizes[len(sizes) // 2], tuple(biggest)
+
+
+def bench_reads() -> dict:
+    user_id = 1
+    (typical, typical_size), (biggest, biggest_size) = pick_worklists(user_id)
+    return {
+        "get_users": latency(db.get_users),
+        "get_worklists": latency(lambda: db.get_worklists(user_id)),
+        "get_tasks_typical": dict(latency(lambda: db.get_tasks(typical)), tasks=typical_size),
+        "get_tasks_biggest": dict(latency(lambda: db.get_tasks(biggest), repeats=5), tasks=biggest_size),
+    }
+
+
+def bench_writes() -> dict:
+    (worklist_id, _), _ = pick_worklists(1)
+    tasks = []
+    results = {"create_task": throughput(lambda i: tasks.append(db.create_task(f"bench task {i}", worklist_id=worklist_id)))}
+
+    def update(i):
+        task = tasks[i]
+        task.completed = not task.completed
+        db.update_entity(task)
+    results["update_entity"] = throughput(update)
+    results["delete_entity"] = throughput(lambda i: db.delete_entity(tasks[i]))
+    return results
+
+
+def bench_repl() -> dict:
+    from todolist.repl.app import AppState, Step, STEP_LISTS, execute_command
+    from todolist.repl.console import console
+
+    class Prompt:
+        """Answers the repl's prompt with the next command"""
+        command = None
+        def prompt(self, *args, **kwargs):
+            return self.command
+
+    (worklist_id, _), _ = pick_worklists(1)
+    console.file = open(os.devnull, "w") # the tables are still drawn, just not shown
+    state, session = AppState(), Prompt()
+
+    def run(command: str):
+        session.command = command
+        state_key, model = STEP_LISTS[state.app_step]
+        start = time.perf_counter()
+        execute_command(session, state, state_key, model)
+        return time.perf_counter() - start
+
+    def repeat(commands, before=()) -> dict:
+        """Times running commands, after going back to where they start from with before (not timed)"""
+        timings = []
+        for _ in range(REPL_REPEATS):
+            for command in before:
+                run(command)
+            timings.extend(run(command) for command in commands)
+        return summary(timings)
+
+    try:
+        results = {
+            "select_user": repeat(["select 1"], before=["reset user"]),
+            "select_worklist": repeat([f"select {worklist_id}"], before=["reset worklist"]),
+        }
+        first_task = state.all_tasklist_list[0].id if state.all_tasklist_list else 1
+        results["complete"] = repeat([f"complete {first_task}"])
+        results["next_prev"] = repeat(["next", "prev"])
+        results["add"] = repeat(["add bench task"])
+        assert state.app_step == Step.show_task
+    finally:
+        state.repo.close()
+        console.file.close()
+        console.file = None
+    return results
+
+
+def bench_tui() -> dict:
+    from todolist.tui.app import TodoListApp
+
+    async def run() -> dict:
+        start = time.perf_counter()
+        app = TodoListApp()
+        # when the tasks of a worklist are on screen, by worklist id
+        shown = {}
+        show_worklist_tasks = app.show_worklist_tasks
+        async def show(worklist_id: int):
+            await show_worklist_tasks(worklist_id)
+            shown[worklist_id] = time.perf_counter()
+        app.show_worklist_tasks = show
+
+        async def wait_for_tasks(pilot, worklist_id):
+            deadline = time.perf_counter() + TUI_TIMEOUT
+            while worklist_id not in shown:
+                if time.perf_counter() > deadline:
+                    raise TimeoutError(f"the tasks of worklist {worklist_id} were not shown in {TUI_TIMEOUT}s")
+                await pilot.pause(0.001)
+            return shown.pop(worklist_id)
+
+        async with app.run_test(size=(120, 40)) as pilot:
+            mounted = time.perf_counter() - start
+            app.query_one("#user-list-widget").value = "0"
+            worklists = app.query_one("#worklists")
+            while not worklists.worklists:
+                await pilot.pause(0.001)
+            first_tasks = await wait_for_tasks(pilot, worklists.worklists[0].id) - start
+
+            # the time from the key press to the tasks on screen, HIGHLIGHT_DELAY included
+            # unless the worklist was prefetched
+            switches = []
+            worklists.focus()
+            # a user of the small sizes has only a few worklists, the cursor goes down to the last one
+            # and back up as often as it takes to make TUI_SWITCHES switches
+            index, step = 0, 1
+            for _ in range(TUI_SWITCHES if len(worklists.worklists) > 1 else 0):
+                if not 0 <= index + step < len(worklists.worklists):
+                    step = -step
+                index += step
+                shown.clear()
+                start = time.perf_counter()
+                await pilot.press("down" if step > 0 else "up")
+                switches.append(await wait_for_tasks(pilot, worklists.worklists[index].id) - start)
+        app.db.close()
+        return {"mount_ms": mounted * 1000, "first_tasks_ms": first_tasks * 1000, "worklist_switch": summary(switches or [0])}
+
+    return asyncio.run(run())
+
+
+def environment() -> dict:
+    try:
+        commit = subprocess.run(["git", "rev-parse", "--short", "HEAD"], capture_output=True, text=True,
+                                cwd=pathlib.Path(__file__).parent).stdout.strip()
+    except OSError:
+        commit = None
+    return {"commit": commit, "date": datetime.now().isoformat(timespec="seconds"), "python": platform.python_version(),
+            "sqlite": sqlite3.sqlite_version, "platform": platform.platform(), "profile": db.pragma_profile}
+
+
+def flatten(results: dict, prefix: str = "") -> dict:
+    """{"small": {"reads": {"get_users": {"median_ms": 1}}}} -> {"small.reads.get_users.median_ms": 1}"""
+    flat = {}
+    for key, value in results.items():
+        if isinstance(value, dict):
+            flat.update(flatten(value, f"{prefix}{key}."))
+        elif key.endswith("_ms") or key.endswith("_per_s"):
+            flat[prefix + key] = value
+    return flat
+
+
+def compare(results: dict, old: dict):
+    new_numbers, old_numbers = flatten(results["results"]), flatten(old["results"])
+    click.echo(f"\ncompared with {old['environment'].get('commit')} ({old['environment'].get('date')})")
+    for name, value in new_numbers.items():
+        if name not in old_numbers:
+            continue
+        change = (value - old_numbers[name]) / old_numbers[name] * 100 if old_numbers[name] else 0
+        # more time or fewer ops per second is worse
+        worse = change > 0 if name.endswith("_ms") else change < 0
+        mark = "  <-- slower" if worse and abs(change) > REGRESSION else ""
+        click.echo(f"{name:<55} {old_numbers[name]:>12.2f} {value:>12.2f} {change:>+7.1f}%{mark}")
+
+
+@click.command()
+@click.option("--sizes", default="small,medium", show_default=True, help=f"Comma separated, of {', '.join(SIZES)}")
+@click.option("--output", type=click.Path(dir_okay=False), default="benchmark-results.json", show_default=True)
+@click.option("--compare", "baseline", type=click.File("r"), help="Results file of an earlier run to compare with")
+def main(sizes, output, baseline):
+    results = {"environment": environment(), "results": {}}
+    for size in sizes.split(","):
+        users, worklists_per_user, tasks_per_list = SIZES[size]
+        with tempfile.TemporaryDirectory() as folder:
+            db.configure(db_path=pathlib.Path(folder) / f"{size}.db")
+            db.SQLModel.metadata.create_all(db.engine)
+            start = time.perf_counter()
+            tasks = generate_fake_data(users, worklists_per_user, tasks_per_list, seed=0)
+            click.echo(f"{size}: {tasks} tasks, generated in {time.perf_counter() - start:.1f}s", err=True)
+            size_results = results["results"][size] = {"tasks": tasks}
+            for name, bench in (("reads", bench_reads), ("writes", bench_writes), ("repl", bench_repl), ("tui", bench_tui)):
+                size_results[name] = bench()
+                click.echo(f"  {name} done", err=True)
+            db.engine.dispose()
+
+    for name, value in flatten(results["results"]).items():
+        click.echo(f"{name:<55} {value:>12.2f}")
+    pathlib.Path(output).write_text(json.dumps(results, indent=2))
+    click.echo(f"results written to {output}", err=True)
+    if baseline is not None:
+        compare(results, json.load(baseline))
+
+
+if __name__ == "__main__":
+    main()
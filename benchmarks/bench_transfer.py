@@ -0,0 +1,62 @@
+"""Measures todo-import (and todo-export) throughput on a synthetic database.
+
+Run with: python benchmarks/bench_transfer.py [n_users] [repeats]
+n_users users (default 50) of 100 worklists with 100 tasks each on average, 500k tasks by default,
+are exported as JSONL and CSV, then imported into a new empty database repeats times (default 5).
+The timings vary a lot between runs on a busy machine, so the best and the median run are shown.
+The target is over 100k rows/s.
+"""
+import pathlib
+import statistics
+import sys
+import tempfile
+import time
+
+from todolist import db
+from todolist.fake_data import generate_fake_data
+from todolist.transfer import import_records, read_csv, read_jsonl, write_csv, write_jsonl
+
+
+def timed_import(path: pathlib.Path, format_: str, db_path: pathlib.Path) -> float:
+    """Rows per second of one import of path into a new database"""
+    db.configure(db_path=db_path)
+    db.SQLModel.metadata.create_all(db.engine)
+    start = time.perf_counter()
+    with db.engine.begin() as connection:
+        if format_ == "csv":
+            counts = import_records(connection, read_csv(path))
+        else:
+            with open(path) as file:
+                counts = import_records(connection, read_jsonl(file))
+    seconds = time.perf_counter() - start
+    db.engine.dispose()
+    for suffix in ("", "-wal", "-shm"):
+        pathlib.Path(f"{db_path}{suffix}").unlink(missing_ok=True)
+    return sum(counts.values()) / seconds
+
+
+def main():
+    n_users = int(sys.argv[1]) if len(sys.argv) > 1 else 50
+    repeats = int(sys.argv[2]) if len(sys.argv) > 2 else 5
+    with tempfile.TemporaryDirectory() as folder:
+        folder = pathlib.Path(folder)
+        db.configure(db_path=folder / "source.db")
+        db.SQLModel.metadata.create_all(db.engine)
+        tasks = generate_fake_data(n_users, worklists_per_user=100, tasks_per_list=100)
+        with db.engine.connect() as connection:
+            start = time.perf_counter()
+            with open(folder / "export.jsonl", "w") as file:
+                counts = write_jsonl(connection, file)
+            print(f"export jsonl: {sum(counts.values()) / (time.perf_counter() - start):,.0f} rows/s")
+            start = time.perf_counter()
+            write_csv(connection, folder / "export")
+            print(f"export csv:   {sum(counts.values()) / (time.perf_counter() - start):,.0f} rows/s")
+        db.engine.dispose()
+        print(f"importing {sum(counts.values())} rows ({tasks} tasks) {repeats} times")
+        for format_, path in (("jsonl", folder / "export.jsonl"), ("csv", folder / "export")):
+            rates = [timed_import(path, format_, folder / "target.db") for _ in range(repeats)]
+            print(f"import {format_:<6} best {max(rates):>9,.0f} rows/s  median {statistics.median(rates):>9,.0f} rows/s")
+
+
+if __name__ == "__main__":
+    main()
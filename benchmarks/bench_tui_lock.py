@@ -0,0 +1,69 @@
+"""Checks that the tui keeps running while another process holds a write lock on the database.
+
+Run with: python benchmarks/bench_tui_lock.py [lock_seconds]
+A second process holds an exclusive lock (default 2 s) while the tui toggles a task.
+The tui must keep its event loop (and so its rendering) going while the write waits for the lock.
+"""
+import asyncio
+import pathlib
+import subprocess
+import sys
+import tempfile
+import time
+
+from todolist import db
+
+HOLD_LOCK = """
+import sqlite3, sys, time
+connection = sqlite3.connect(sys.argv[1], isolation_level=None)
+connection.execute("BEGIN EXCLUSIVE")
+print("locked", flush=True)
+time.sleep(float(sys.argv[2]))
+connection.execute("COMMIT")
+"""
+
+
+async def watch_event_loop(stalls: list, stop: asyncio.Event):
+    """Records how late each 10 ms tick of the event loop is"""
+    while not stop.is_set():
+        start = time.perf_counter()
+        await asyncio.sleep(0.01)
+        stalls.append(time.perf_counter() - start - 0.01)
+
+
+async def main(lock_seconds: float):
+    from todolist.tui.app import TodoListApp
+
+    app = TodoListApp()
+    async with app.run_test() as pilot:
+        app.query_one("#user-list-widget").value = "0"
+        await pilot.pause(0.5)
+
+        locker = subprocess.Popen([sys.executable, "-c", HOLD_LOCK, str(db.sqlite_file_name), str(lock_seconds)],
+                                  stdout=subprocess.PIPE, text=True)
+        locker.stdout.readline()  # wait until the lock is taken
+
+        stalls, stop = [], asyncio.Event()
+        watcher = asyncio.create_task(watch_event_loop(stalls, stop))
+        start = time.perf_counter()
+        app.query("Switch").first().value = True  # saves the task in the background
+        while not app.workers:
+            await asyncio.sleep(0.01)
+        await app.workers.wait_for_complete()
+        write_seconds = time.perf_counter() - start
+        stop.set()
+        await watcher
+        locker.wait()
+
+    saved = db.get_tasks(1)[0].completed
+    print(f"write finished after {write_seconds:.2f}s (lock held {lock_seconds}s), saved={saved}")
+    print(f"event loop ticks during the lock: {len(stalls)}, worst stall {max(stalls) * 1000:.1f} ms")
+
+
+if __name__ == "__main__":
+    lock_seconds = float(sys.argv[1]) if len(sys.argv) > 1 else 2.0
+    with tempfile.TemporaryDirectory() as folder:
+        db.configure(db_path=pathlib.Path(folder) / "lock.db")
+        db.create_db_and_tables()
+        asyncio.run(main(lock_seconds))
+        db.engine.dispose()
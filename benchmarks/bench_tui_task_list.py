@@ -0,0 +1,49 @@
+"""Measures showing and scrolling long task lists in the tui.
+
+Run with: python benchmarks/bench_tui_task_list.py [tasks ...]
+For each size (default 100 1000 10000 100000) the task list shows that many tasks, then jumps
+to the middle and the end. Time and the number of mounted widgets should not grow with the size.
+"""
+import asyncio
+import sys
+import time
+from datetime import date
+
+from textual.app import App
+
+from todolist.db import TaskRow
+from todolist.tui.widgets.task_list import TaskItem, TaskList
+
+
+class TaskListApp(App):
+    def compose(self):
+        yield TaskList(id="task-items")
+
+
+async def bench(n: int):
+    rows = [TaskRow(i, 1, f"task {i}", date.today(), i % 3 == 0) for i in range(1, n + 1)]
+    app = TaskListApp()
+    async with app.run_test(size=(100, 50)) as pilot:
+        task_list = app.query_one(TaskList)
+        await pilot.pause()
+
+        start = time.perf_counter()
+        await task_list.show_rows(rows)
+        await pilot.pause()
+        show = time.perf_counter() - start
+
+        timings = []
+        for y in (task_list.max_scroll_y // 2, task_list.max_scroll_y):
+            start = time.perf_counter()
+            task_list.scroll_to(y=y, animate=False)
+            # wait for the rows at the new position
+            while not task_list.tasks or task_list.tasks[-1].id < y // 6:
+                await pilot.pause()
+            timings.append(time.perf_counter() - start)
+        print(f"{n:>8} tasks  show {show * 1000:7.1f} ms  jump to middle {timings[0] * 1000:6.1f} ms  "
+              f"to end {timings[1] * 1000:6.1f} ms  widgets {len(app.query('*')):>4}  task items {len(app.query(TaskItem))}")
+
+
+if __name__ == "__main__":
+    for n in map(int, sys.argv[1:] or [100, 1000, 10000, 100000]):
+        asyncio.run(bench(n))
@@ -0,0 +1,54 @@
+"""An asyncio version of the todolist.db API
+
+All the database work runs on one dedicated thread that owns a Repository. An event loop
+(like the one of the tui) only awaits the result, so it keeps running while sqlite is slow
+or the database is locked by another process.
+"""
+import asyncio
+from concurrent.futures import ThreadPoolExecutor
+from typing import Callable
+
+from todolist.db import Repository
+
+
+class AsyncRepository:
+    """Every Repository method as a coroutine that runs on the db thread:
+
+        tasks = await adb.get_task_rows(worklist_id)
+
+    Use transaction() to run several calls as one command (one commit).
+    """
+
+    def __init__(self):
+        # one thread, so the Repository session is only ever used from that thread
+        self._executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="todolist-db")
+        self.repo: Repository = self._executor.submit(Repository).result()
+
+    async def run(self, fn: Callable, *args, **kwargs):
+        """Runs fn(*args, **kwargs) on the db thread and waits for it without blocking the event loop"""
+        return await asyncio.wrap_future(self._executor.submit(fn, *args, **kwargs))
+
+    def run_sync(self, fn: Callable, *args, **kwargs):
+        """Runs fn on the db thread and blocks until it is done. For use outside of the event loop (e.g. startup)"""
+        return self._executor.submit(fn, *args, **kwargs).result()
+
+    async def transaction(self, fn: Callable, *args, **kwargs):
+        """Runs fn(repo, *args, **kwargs) on the db thread inside one repo.command()"""
+        def work():
+            with self.repo.command():
+                return fn(self.repo, *args, **kwargs)
+        return await self.run(work)
+
+    def __getattr__(self, name: str):
+        method = getattr(Repository, name)  # raises AttributeError for names Repository does not have
+        if not callable(method) or name.startswith("_"):
+            raise AttributeError(name)
+
+        async def call(*args, **kwargs):
+            return await self.run(getattr(self.repo, name), *args, **kwargs)
+        call.__name__ = name
+        return call
+
+    def close(self):
+        self.run_sync(self.repo.close)
+        self._executor.shutdown()
@@ -1,26 +1,85 @@
+import os
 import pathlib
-from datetime import date
-from typing import Optional, List  # 
+import re
+import sys
+import time
+from contextlib import contextmanager
+from datetime import date, timedelta
+from itertools import islice
+from typing import Optional, List, Iterable, Iterator, NamedTuple, Tuple, Union  # 
 
-from sqlmodel import Field, SQLModel, create_engine, Column, Integer, ForeignKey, Session
+import click
+from sqlalchemy.pool import QueuePool
+from sqlmodel import Field, SQLModel, create_engine, Column, Integer, ForeignKey, Index, Session
+
+from todolist import query_stats
 
 TOP_DIR = pathlib.Path(__file__).parent
 
 # Database connection goes here
-sqlite_file_name =  TOP_DIR / 'database' / 'database.db'
+# Set TODOLIST_DB to use another database file
+sqlite_file_name = pathlib.Path(os.environ.get("TODOLIST_DB", TOP_DIR / 'database' / 'database.db'))
 sqlite_url = f"sqlite:///{sqlite_file_name}"  # 
-engine = create_engine(sqlite_url, echo=False)  # 
 
-# This is needed to enforce foreign key constraints
-# You can ignore this
+def _create_engine(url:str):
+    # sqlalchemy 1.4 opens a new sqlite connection for every transaction of a file db (NullPool),
+    # running the pragmas again each time. A pool keeps them open, a commit then costs what sqlite needs.
+    # A pooled connection can be opened on one thread and checked out on another later: the tui makes
+    # its queries on its db thread (todolist.async_db) while startup, the imports and dispose() run on
+    # the main thread. sqlite3 refuses that unless check_same_thread is off. It is safe because the
+    # pool hands a connection to one checkout at a time, and a checkout (a Session or connect()) is
+    # only used by the thread that made it, so two threads never use a connection at the same time
+    connect_args = {"check_same_thread": False}
+    if query_stats.ENABLED:
+        connect_args["factory"] = query_stats.CountingConnection
+    engine = create_engine(url, echo=False, poolclass=QueuePool, connect_args=connect_args)
+    if query_stats.ENABLED:
+        query_stats.instrument(engine, api_file=__file__)
+    return engine
+
+engine = _create_engine(sqlite_url)  # 
+
+# SQLite settings applied to every new connection. Pick one with TODOLIST_DB_PROFILE or configure(profile=...)
+# Both use WAL so the repl and the tui can read while the other one is writing
+PRAGMA_PROFILES = {
+    # every commit is synced to disk before it returns
+    "durable": dict(journal_mode="WAL", synchronous="FULL", busy_timeout=5000,
+                    cache_size=-2000, temp_store="DEFAULT", mmap_size=0),
+    # commits are only synced at WAL checkpoints. A power loss can lose the last commits but not corrupt the db
+    "fast": dict(journal_mode="WAL", synchronous="NORMAL", busy_timeout=5000,
+                 cache_size=-64000, temp_store="MEMORY", mmap_size=256 * 1024 * 1024),
+}
+pragma_profile = os.environ.get("TODOLIST_DB_PROFILE", "durable")
+
+def configure(db_path=None, profile:Optional[str]=None):
+    """Points the app at another database file and/or pragma profile.
+    The old engine is disposed, new connections pick up the settings.
+    """
+    global engine, sqlite_file_name, sqlite_url, pragma_profile
+    if profile is not None:
+        if profile not in PRAGMA_PROFILES:
+            raise ValueError(f"Unknown pragma profile {profile!r}, choose one of {list(PRAGMA_PROFILES)}")
+        pragma_profile = profile
+    if db_path is not None:
+        sqlite_file_name = pathlib.Path(db_path)
+        sqlite_url = f"sqlite:///{sqlite_file_name}"
+    engine.dispose()
+    engine = _create_engine(sqlite_url)
+    return engine
+
+# This is needed to enforce foreign key constraints and apply the pragma profile
 from sqlalchemy.engine import Engine
-from sqlalchemy import event
+from sqlalchemy import DDL, and_, cast, delete, event, func, insert, not_, or_, select, text, update
 from sqlite3 import Connection as SQLite3Connection
 @event.listens_for(Engine, "connect")
 def set_sqlite_pragma(dbapi_connection, connection_record):
     if isinstance(dbapi_connection, SQLite3Connection):
         cursor = dbapi_connection.cursor()
         cursor.execute("PRAGMA foreign_keys=ON")
+        # the search index triggers call it
+        dbapi_connection.create_function("task_search_terms", 2, search_terms, deterministic=True)
+        for pragma, value in PRAGMA_PROFILES[pragma_profile].items():
+            cursor.execute(f"PRAGMA {pragma}={value}")
         cursor.close()
 
 ### Model Definitions ###
@@ -32,21 +91,110 @@ class User(SQLModel, table=True):  #
 class Worklist(SQLModel, table=True):  # 
     id: Optional[int] = Field(default=None, primary_key=True)  # 
     user_id: Optional[int] = Field(
-        sa_column=Column(Integer, ForeignKey("user.id", ondelete="CASCADE"))
+        sa_column=Column(Integer, ForeignKey("user.id", ondelete="CASCADE"), index=True)
     )
     name: str
-    date_created: str
+    date_created: date
 
 class Task(SQLModel, table=True):  # 
+    __table_args__ = (
+        Index("ix_task_worklist_id_completed", "worklist_id", "completed"),
+        # the tasks of a worklist by day, for get_tasks_between
+        Index("ix_task_worklist_id_date_created", "worklist_id", "date_created"),
+        # only the open tasks, oldest first, for get_stale_tasks
+        Index("ix_task_open_date_created", "date_created", sqlite_where=text("completed = 0")),
+    )
     id: Optional[int] = Field(default=None, primary_key=True)  # 
     worklist_id: Optional[int] = Field(
-        sa_column=Column(Integer, ForeignKey("worklist.id", ondelete="CASCADE"))  
+        # a plain index on worklist_id is also ordered by id, so get_tasks does not need to sort
+        sa_column=Column(Integer, ForeignKey("worklist.id", ondelete="CASCADE"), index=True)
     )
     task: str
-    date_created: str
+    date_created: date
     completed: bool
 
+### Full Text Search ###
+# task_search is an FTS5 index of the words of every task, each word stored with the id of the user
+# whose task it is: "buy milk" of user 7 is indexed as the terms 7xbuy and 7xmilk. A search only
+# looks up the terms of its user, so it reads the user's matches and nothing else, whatever the
+# other users have, and bm25 ranks all of them. The index keeps no copy of the text (content='').
+# The triggers below keep it in sync with task and worklist, ON DELETE CASCADE included. They call
+# task_search_terms, a python function every connection of the app gets (set_sqlite_pragma):
+# writing tasks with another sqlite client fails with "no such function: task_search_terms".
+_WORD = re.compile(r"[^\W_]+")
+
+def search_terms(user_id, text:Optional[str]) -> str:
+    """The terms task_search indexes for a task of user_id. sqlite lowercases them"""
+    if user_id is None or not text:
+        return ""
+    words = text.split()
+    if not "".join(words).isalnum(): # punctuation, the regex finds the words around it
+        words = _WORD.findall(text)
+    prefix = f"{user_id}x"
+    return prefix + f" {prefix}".join(words) if words else ""
+
+SEARCH_INDEX_DDL = [
+    "CREATE VIRTUAL TABLE IF NOT EXISTS task_search USING fts5(terms, content='')",
+    # a task of a worklist without a user, or without a worklist, is not indexed
+    """CREATE TRIGGER IF NOT EXISTS task_search_insert AFTER INSERT ON task BEGIN
+        INSERT INTO task_search(rowid, terms)
+        SELECT new.id, task_search_terms(user_id, new.task) FROM worklist WHERE id = new.worklist_id;
+    END""",
+    # removing an entry takes the terms it was indexed with. When the worklist is deleted its
+    # tasks are already out of the index (task_search_worklist_delete) and the worklist is gone
+    """CREATE TRIGGER IF NOT EXISTS task_search_delete AFTER DELETE ON task BEGIN
+        INSERT INTO task_search(task_search, rowid, terms)
+        SELECT 'delete', old.id, task_search_terms(user_id, old.task) FROM worklist WHERE id = old.worklist_id;
+    END""",
+    """CREATE TRIGGER IF NOT EXISTS task_search_update AFTER UPDATE OF task, worklist_id ON task BEGIN
+        INSERT INTO task_search(task_search, rowid, terms)
+        SELECT 'delete', old.id, task_search_terms(user_id, old.task) FROM worklist WHERE id = old.worklist_id;
+        INSERT INTO task_search(rowid, terms)
+        SELECT new.id, task_search_terms(user_id, new.task) FROM worklist WHERE id = new.worklist_id;
+    END""",
+    """CREATE TRIGGER IF NOT EXISTS task_search_worklist_delete BEFORE DELETE ON worklist BEGIN
+        INSERT INTO task_search(task_search, rowid, terms)
+        SELECT 'delete', id, task_search_terms(old.user_id, task) FROM task WHERE worklist_id = old.id;
+    END""",
+    """CREATE TRIGGER IF NOT EXISTS task_search_worklist_update AFTER UPDATE OF user_id ON worklist BEGIN
+        INSERT INTO task_search(task_search, rowid, terms)
+        SELECT 'delete', id, task_search_terms(old.user_id, task) FROM task WHERE worklist_id = old.id;
+        INSERT INTO task_search(rowid, terms)
+        SELECT id, task_search_terms(new.user_id, task) FROM task WHERE worklist_id = new.id;
+    END""",
+]
+SEARCH_INDEX_NAMES = ("task_search", "task_search_insert", "task_search_delete", "task_search_update",
+                      "task_search_worklist_delete", "task_search_worklist_update")
+# the index of older versions, a plain fts5 over task.task with these triggers
+LEGACY_SEARCH_INDEX_DDL = [f"DROP TRIGGER IF EXISTS task_fts_{name}" for name in ("insert", "delete", "update")] + \
+    ["DROP TABLE IF EXISTS task_fts"]
+
+def has_search_index(connection) -> bool:
+    """Whether task_search and all its triggers are there. Tasks added while one was missing are not indexed"""
+    names = set(connection.exec_driver_sql(
+        f"SELECT name FROM sqlite_master WHERE name IN ({', '.join('?' * len(SEARCH_INDEX_NAMES))})",
+        SEARCH_INDEX_NAMES).scalars())
+    return len(names) == len(SEARCH_INDEX_NAMES)
+
+def create_search_index(connection, rebuild:bool=False):
+    """Creates task_search and its triggers if missing, dropping the index of older versions.
+    rebuild=True indexes again the tasks already in the table"""
+    for statement in LEGACY_SEARCH_INDEX_DDL + SEARCH_INDEX_DDL:
+        connection.exec_driver_sql(statement)
+    if rebuild:
+        connection.exec_driver_sql("INSERT INTO task_search(task_search) VALUES ('delete-all')")
+        connection.exec_driver_sql(
+            "INSERT INTO task_search(rowid, terms) SELECT task.id, task_search_terms(worklist.user_id, task.task) "
+            "FROM task JOIN worklist ON worklist.id = task.worklist_id ORDER BY task.id")
+
+event.listen(Task.__table__, "after_create", lambda target, connection, **kw: create_search_index(connection))
+event.listen(Task.__table__, "before_drop", DDL("DROP TABLE IF EXISTS task_search"))
+
 ### Function Definitions ###
+def _as_date(value:Union[str, date, None]) -> Optional[date]:
+    """Dates can also be given as 2024-01-31, the way they were stored as text"""
+    return date.fromisoformat(value) if isinstance(value, str) else value
+
 def create_user(first_name:str, last_name:str, save=True):
     user = User(first_name=first_name, last_name=last_name)
     if save:
@@ -56,9 +204,8 @@ def create_user(first_name:str, last_name:str, save=True):
             session.refresh(user)
     return user
 
-def create_worklist(name:str, date_created:str=None, user_id:Optional[int]=None, save=True):
-    if date_created is None:
-        date_created = str(date.today())
+def create_worklist(name:str, date_created:Union[str, date]=None, user_id:Optional[int]=None, save=True):
+    date_created = _as_date(date_created) or date.today()
     worklist = Worklist(name=name, date_created=date_created, user_id=user_id)
     if save:
         with Session(engine) as session:
@@ -68,10 +215,9 @@ def create_worklist(name:str, date_created:str=None, user_id:Optional[int]=None,
 
     return worklist
 
-def create_task(task:str, date_created:str=None, completed:bool=False, worklist_id:Optional[int]=None, save=True):
-    if date_created is None:
-        date_created = str(date.today())
-    
+def create_task(task:str, date_created:Union[str, date]=None, completed:bool=False, worklist_id:Optional[int]=None, save=True):
+    date_created = _as_date(date_created) or date.today()
+
     task = Task(task=task, date_created=date_created, completed=completed, worklist_id=worklist_id)
     if save:
         with Session(engine) as session:
@@ -81,18 +227,325 @@ def create_task(task:str, date_created:str=None, completed:bool=False, worklist_
 
     return task
 
+### Bulk Functions ###
+# How many rows are sent to sqlite in a single executemany/transaction
+BULK_CHUNK_SIZE = 5000
+
+def _chunked(iterable:Iterable, size:int):
+    """Yields lists of at most `size` items, works with generators too"""
+    iterator = iter(iterable)
+    while True:
+        chunk = list(islice(iterator, size))
+        if not chunk:
+            return
+        yield chunk
+
+def _bulk_insert(model:SQLModel, rows:Iterable[dict], chunk_size:int=BULK_CHUNK_SIZE) -> List[int]:
+    """Inserts rows into the table of `model` with one executemany per chunk.
+    The ids are assigned here (instead of by sqlite) so we can hand them back without a refresh.
+    """
+    ids = []
+    with Session(engine) as session:
+        for chunk in _chunked(rows, chunk_size):
+            ids += _insert_chunk(session, model, chunk)
+            session.commit()
+    return ids
+
+def _lock_for_write(connection):
+    """Takes sqlite's write lock now, unless the transaction already holds it. sqlite3 only begins a
+    transaction at the first insert, update or delete, so what is read before that (like max(id))
+    can be changed by another writer in between, and DDL before that is committed right away"""
+    if not connection.connection.dbapi_connection.in_transaction:
+        connection.exec_driver_sql("BEGIN IMMEDIATE")
+
+def _insert_chunk(session:Session, model:SQLModel, chunk:List[dict]) -> List[int]:
+    """One executemany insert of the rows in chunk, in the session's transaction. Returns their ids"""
+    table = model.__table__
+    # nobody else can insert between reading max(id) and the insert
+    _lock_for_write(session.connection())
+    last_id = session.execute(select(func.max(table.c.id))).scalar() or 0
+    last_id = max([last_id] + [row['id'] for row in chunk if row['id'] is not None])
+    for row in chunk:
+        if row['id'] is None:
+            last_id += 1
+            row['id'] = last_id
+    session.execute(insert(table), chunk)
+    return [row['id'] for row in chunk]
+
+def _as_dict(item) -> dict:
+    return item.dict() if isinstance(item, SQLModel) else dict(item)
+
+def create_worklists_bulk(worklists:Iterable[Union[str, dict, Worklist]], user_id:Optional[int]=None,
+                          chunk_size:int=BULK_CHUNK_SIZE) -> List[int]:
+    """Creates many worklists at once. Items can be a name, a dict, or a Worklist. Returns the new ids"""
+    today = date.today()
+    def rows():
+        for item in worklists:
+            item = dict(name=item) if isinstance(item, str) else _as_dict(item)
+            yield dict(id=item.get('id'), name=item['name'],
+                       date_created=_as_date(item.get('date_created')) or today,
+                       user_id=item.get('user_id') or user_id)
+    return _bulk_insert(Worklist, rows(), chunk_size)
+
+def _task_rows(tasks:Iterable[Union[str, dict, Task]], worklist_id:Optional[int]=None) -> Iterator[dict]:
+    today = date.today()
+    for item in tasks:
+        item = dict(task=item) if isinstance(item, str) else _as_dict(item)
+        yield dict(id=item.get('id'), task=item['task'],
+                   date_created=_as_date(item.get('date_created')) or today,
+                   completed=bool(item.get('completed', False)),
+                   worklist_id=item.get('worklist_id') or worklist_id)
+
+def create_tasks_bulk(tasks:Iterable[Union[str, dict, Task]], worklist_id:Optional[int]=None,
+                      chunk_size:int=BULK_CHUNK_SIZE) -> List[int]:
+    """Creates many tasks at once. Items can be the task text, a dict, or a Task. Returns the new ids"""
+    return _bulk_insert(Task, _task_rows(tasks, worklist_id), chunk_size)
+
 def get_users() -> List[User]:
     with Session(engine) as session:
         return list(session.query(User).all())
     
 def get_worklists(user_id=1):
     with Session(engine) as session:
-        return list(session.query(Worklist).where(Worklist.user_id == user_id))
+        return list(session.query(Worklist).where(Worklist.user_id == user_id).order_by(Worklist.id))
     
 def get_tasks(worklist_id=1):
     with Session(engine) as session:
-        return list(session.query(Task).where(Task.worklist_id == worklist_id))
+        return list(session.query(Task).where(Task.worklist_id == worklist_id).order_by(Task.id))
     
+### Paging Functions ###
+# Pages use keyset pagination on id (WHERE id > last_id LIMIT n), so every page costs
+# the same no matter how deep into the list it is
+PAGE_SIZE = 50
+
+def _page(query, model:SQLModel, after_id:Optional[int]=None, before_id:Optional[int]=None, limit:int=PAGE_SIZE) -> List:
+    """The page of `query` right after `after_id`, or right before `before_id`. Always in id order"""
+    query = query.execution_options(populate_existing=True)
+    if before_id is not None:
+        query = query.where(model.id < before_id).order_by(model.id.desc()).limit(limit)
+        return list(query)[::-1]
+    if after_id is not None:
+        query = query.where(model.id > after_id)
+    return list(query.order_by(model.id).limit(limit))
+
+def get_worklists_page(user_id=1, after_id:Optional[int]=None, before_id:Optional[int]=None, limit:int=PAGE_SIZE) -> List[Worklist]:
+    with Session(engine) as session:
+        return _page(session.query(Worklist).where(Worklist.user_id == user_id), Worklist, after_id, before_id, limit)
+
+def get_tasks_page(worklist_id=1, after_id:Optional[int]=None, before_id:Optional[int]=None, limit:int=PAGE_SIZE) -> List[Task]:
+    with Session(engine) as session:
+        return _page(session.query(Task).where(Task.worklist_id == worklist_id), Task, after_id, before_id, limit)
+
+def _iter_pages(get_page, parent_id, page_size:int) -> Iterator:
+    after_id = None
+    while True:
+        page = get_page(parent_id, after_id=after_id, limit=page_size)
+        yield from page
+        if len(page) < page_size:
+            return
+        after_id = page[-1].id
+
+def iter_worklists(user_id=1, page_size:int=PAGE_SIZE) -> Iterator[Worklist]:
+    """Streams all the worklists of a user, only one page is in memory at a time"""
+    return _iter_pages(get_worklists_page, user_id, page_size)
+
+def iter_tasks(worklist_id=1, page_size:int=PAGE_SIZE) -> Iterator[Task]:
+    """Streams all the tasks of a worklist, only one page is in memory at a time"""
+    return _iter_pages(get_tasks_page, worklist_id, page_size)
+
+### Read Projections ###
+# Light, read only rows for showing lists. They are built straight from sqlalchemy core rows,
+# skipping the ORM and pydantic. Load the real entity (get_entity) when you want to change it.
+class WorklistRow(NamedTuple):
+    id: int
+    user_id: Optional[int]
+    name: str
+    date_created: date
+
+class TaskRow(NamedTuple):
+    id: int
+    worklist_id: Optional[int]
+    task: str
+    date_created: date
+    completed: bool
+
+def to_row(entity):
+    """Turns a Worklist or Task into its row"""
+    row_class = WorklistRow if isinstance(entity, Worklist) else TaskRow
+    return row_class._make(getattr(entity, name) for name in row_class._fields)
+
+class WorklistSummary(NamedTuple):
+    """A worklist row plus the counts of its tasks"""
+    id: int
+    user_id: Optional[int]
+    name: str
+    date_created: date
+    total: int
+    completed: int
+    last_task_created: Optional[date]  # date_created of the newest task
+
+    @property
+    def open(self) -> int:
+        return self.total - self.completed
+
+def _rows_page(session:Session, row_class, statement, id_column, after_id:Optional[int]=None,
+               before_id:Optional[int]=None, limit:Optional[int]=PAGE_SIZE, offset:int=0) -> List:
+    """Same as _page but for a core select, returns rows of row_class. limit=None returns everything.
+    offset skips rows after after_id, for jumping somewhere into a list (e.g. a scrolled view)"""
+    if before_id is not None:
+        statement = statement.where(id_column < before_id).order_by(id_column.desc()).limit(limit)
+        return list(map(row_class._make, session.execute(statement)))[::-1]
+    if after_id is not None:
+        statement = statement.where(id_column > after_id)
+    statement = statement.order_by(id_column).limit(limit)
+    if offset:
+        statement = statement.offset(offset)
+    return list(map(row_class._make, session.execute(statement)))
+
+def _select_rows(row_class, model:SQLModel):
+    table = model.__table__
+    return select(*[table.c[name] for name in row_class._fields])
+
+def _select_worklist_summaries(user_id):
+    worklist, task = Worklist.__table__, Task.__table__
+    return (select(worklist.c.id, worklist.c.user_id, worklist.c.name, worklist.c.date_created,
+                   func.count(task.c.id),
+                   func.coalesce(func.sum(cast(task.c.completed, Integer)), 0),
+                   func.max(task.c.date_created))
+            .select_from(worklist.outerjoin(task, task.c.worklist_id == worklist.c.id))
+            .where(worklist.c.user_id == user_id)
+            .group_by(worklist.c.id))
+
+def get_worklist_rows(user_id=1, after_id:Optional[int]=None, before_id:Optional[int]=None, limit:Optional[int]=None) -> List[WorklistRow]:
+    with Session(engine) as session:
+        statement = _select_rows(WorklistRow, Worklist).where(Worklist.user_id == user_id)
+        return _rows_page(session, WorklistRow, statement, Worklist.id, after_id, before_id, limit)
+
+def get_task_rows(worklist_id=1, after_id:Optional[int]=None, before_id:Optional[int]=None, limit:Optional[int]=None,
+                  offset:int=0) -> List[TaskRow]:
+    with Session(engine) as session:
+        statement = _select_rows(TaskRow, Task).where(Task.worklist_id == worklist_id)
+        return _rows_page(session, TaskRow, statement, Task.id, after_id, before_id, limit, offset)
+
+def _count_tasks(worklist_id):
+    return select(func.count()).select_from(Task.__table__).where(Task.worklist_id == worklist_id)
+
+def count_tasks(worklist_id=1) -> int:
+    with Session(engine) as session:
+        return session.execute(_count_tasks(worklist_id)).scalar_one()
+
+def get_worklist_summaries(user_id=1, after_id:Optional[int]=None, before_id:Optional[int]=None, limit:Optional[int]=None,
+                           offset:int=0) -> List[WorklistSummary]:
+    """The worklists of a user with their total and completed task counts, all from one GROUP BY query"""
+    with Session(engine) as session:
+        return _rows_page(session, WorklistSummary, _select_worklist_summaries(user_id), Worklist.id, after_id, before_id, limit, offset)
+
+def _count_worklists(user_id):
+    return select(func.count()).select_from(Worklist.__table__).where(Worklist.user_id == user_id)
+
+def count_worklists(user_id=1) -> int:
+    with Session(engine) as session:
+        return session.execute(_count_worklists(user_id)).scalar_one()
+
+def _search_query(user_id, text:str, prefix:bool=False) -> str:
+    """Turns what the user typed into an FTS5 query over the terms of the user (see search_terms).
+    Every word must match, with prefix the last one as a prefix. Empty when there is no word"""
+    words = _WORD.findall(text)
+    return " ".join(f'"{user_id}x{word}"' for word in words) + ("*" if words and prefix else "")
+
+# The matches come from the terms of the user alone, so bm25, fts5's relevance score, ranks every
+# match of the user and only them. Equal scores put the newest task first
+_SEARCH_TASKS = text("""
+    SELECT task.id, task.worklist_id, task.task, task.date_created, task.completed
+    FROM (
+        SELECT rowid AS id, bm25(task_search) AS rank
+        FROM task_search
+        WHERE task_search MATCH :query
+        ORDER BY rank, rowid DESC
+        LIMIT :limit
+    ) AS found
+    JOIN task ON task.id = found.id
+    ORDER BY found.rank, task.id DESC
+""").columns(*[Task.__table__.c[name] for name in TaskRow._fields])
+
+def _search_tasks(session:Session, user_id, query:str, limit:int) -> List[TaskRow]:
+    if not _WORD.search(query):
+        return []
+    params = dict(limit=limit)
+    # whole words first, the last word as a prefix only when there are not enough matches
+    rows = list(map(TaskRow._make, session.execute(_SEARCH_TASKS, dict(params, query=_search_query(user_id, query)))))
+    if len(rows) < limit:
+        found = {row.id for row in rows}
+        more = session.execute(_SEARCH_TASKS, dict(params, query=_search_query(user_id, query, prefix=True)))
+        rows += [row for row in map(TaskRow._make, more) if row.id not in found][:limit - len(rows)]
+    return rows
+
+def search_tasks(user_id, query:str, limit:int=20) -> List[TaskRow]:
+    """Full text search over the tasks of a user, best matches (bm25) first"""
+    with Session(engine) as session:
+        return _search_tasks(session, user_id, query, limit)
+
+### Dates ###
+# date_created is a DATE, which sqlite keeps as 2024-01-31 text. That sorts like the days do,
+# so a range of days is a range scan of ix_task_worklist_id_date_created or ix_task_open_date_created
+
+def _select_tasks_between(user_id, start:Optional[date], end:Optional[date], limit:int):
+    task, worklist = Task.__table__, Worklist.__table__
+    statement = (_select_rows(TaskRow, Task)
+                 .join(worklist, worklist.c.id == task.c.worklist_id)
+                 .where(worklist.c.user_id == user_id))
+    if start is not None:
+        statement = statement.where(task.c.date_created >= start)
+    if end is not None:
+        statement = statement.where(task.c.date_created <= end)
+    return statement.order_by(task.c.date_created.desc(), task.c.id.desc()).limit(limit)
+
+def get_tasks_between(user_id, start:Optional[date]=None, end:Optional[date]=None, limit:int=100) -> List[TaskRow]:
+    """The tasks of a user created from start to end, both days included (None leaves that side open). Newest first"""
+    with Session(engine) as session:
+        return list(map(TaskRow._make, session.execute(_select_tasks_between(user_id, start, end, limit))))
+
+def _select_stale_tasks(days:int, user_id, limit:int):
+    task, worklist = Task.__table__, Worklist.__table__
+    # not_(completed) is written completed = 0, the condition of the partial index
+    statement = _select_rows(TaskRow, Task).where(not_(task.c.completed),
+                                                  task.c.date_created < date.today() - timedelta(days=days))
+    if user_id is not None:
+        statement = (statement.join(worklist, worklist.c.id == task.c.worklist_id)
+                     .where(worklist.c.user_id == user_id))
+    return statement.order_by(task.c.date_created, task.c.id).limit(limit)
+
+def get_stale_tasks(days:int, user_id=None, limit:int=100) -> List[TaskRow]:
+    """The tasks still open that were created more than days ago, oldest first. Of every user unless user_id is given"""
+    with Session(engine) as session:
+        return list(map(TaskRow._make, session.execute(_select_stale_tasks(days, user_id, limit))))
+
+class DateFilter(NamedTuple):
+    since: Optional[date] = None
+    until: Optional[date] = None
+    stale_days: Optional[int] = None
+
+def parse_day(text:str, today:Optional[date]=None) -> date:
+    """A day typed by a user: 2024-01-31, today, yesterday, or 7d for 7 days ago. ValueError otherwise"""
+    today = today or date.today()
+    text = text.strip().lower()
+    if text in ("today", "yesterday"):
+        return today - timedelta(days=text == "yesterday")
+    if text.endswith("d") and text[:-1].isdigit():
+        return today - timedelta(days=int(text[:-1]))
+    return date.fromisoformat(text)
+
+def parse_date_filter(text:str) -> DateFilter:
+    """'since <day>', 'until <day>', both, or 'stale <days>', the way the repl and the tui take it"""
+    words = text.lower().split()
+    if len(words) == 2 and words[0] == "stale" and words[1].isdigit():
+        return DateFilter(stale_days=int(words[1]))
+    days = dict(zip(words[::2], words[1::2]))
+    if not words or len(words) % 2 or len(days) < len(words) // 2 or set(days) - {"since", "until"}:
+        raise ValueError(f"'{text}' is not a date filter, use since <day>, until <day> or stale <days>")
+    return DateFilter(since=parse_day(days["since"]) if "since" in days else None,
+                      until=parse_day(days["until"]) if "until" in days else None)
+
 def update_entity(entity):
     with Session(engine) as session:
         session.add(entity)
@@ -110,20 +563,312 @@ def delete_entity(entity):
         session.delete(entity)
         session.commit()
 
+### Changes to many rows, each one sql statement ###
+# ids are given as a list of (first, last) ranges, a single id is (id, id). None means all the rows
+
+IdRanges = Optional[List[Tuple[int, int]]]
+
+def _in_ranges(column, ranges:List[Tuple[int, int]]):
+    """id IN (...) for the single ids, first <= id AND id <= last for the ranges.
+    (not BETWEEN, the session can't evaluate that one; sqlite uses the index for both)"""
+    singles = [first for first, last in ranges if first == last]
+    clauses = [and_(column >= first, column <= last) for first, last in ranges if first != last]
+    if len(singles) == 1:
+        clauses.append(column == singles[0]) # cheaper to build and run than an IN of one id
+    elif singles:
+        clauses.append(column.in_(singles))
+    return or_(*clauses)
+
+def _where_ids(statement, model:SQLModel, ranges:IdRanges):
+    # evaluate keeps the entities already loaded in a session in line with the change
+    statement = statement.execution_options(synchronize_session="evaluate")
+    return statement if ranges is None else statement.where(_in_ranges(model.id, ranges))
+
+def _toggle_tasks(worklist_id, ranges:IdRanges):
+    statement = update(Task).where(Task.worklist_id == worklist_id).values(completed=not_(Task.completed))
+    return _where_ids(statement, Task, ranges)
+
+def _delete_tasks(worklist_id, ranges:IdRanges):
+    return _where_ids(delete(Task).where(Task.worklist_id == worklist_id), Task, ranges)
+
+def _delete_worklists(user_id, ranges:IdRanges):
+    # their tasks go too, the foreign key cascades
+    return _where_ids(delete(Worklist).where(Worklist.user_id == user_id), Worklist, ranges)
+
+def _delete_by_id(model:SQLModel, ids:List[int]):
+    # a worklist takes its tasks along in the database (ON DELETE CASCADE), none are loaded
+    return delete(model).where(model.id.in_(ids)).execution_options(synchronize_session="evaluate")
+
+def _set_completed(task_ids:List[int], value:bool):
+    statement = update(Task).where(Task.id.in_(task_ids)).values(completed=value)
+    return statement.execution_options(synchronize_session="evaluate")
+
+def _execute(session:Session, statement):
+    """Runs one of the statements above. Working out their change for the entities loaded in the
+    session (synchronize_session="evaluate") costs more than running them, so it is skipped when
+    the session holds no entity of the table they change"""
+    if any(key[0].__table__ is statement.table for key in session.identity_map.keys()):
+        return session.execute(statement)
+    return session.execute(statement, execution_options={"synchronize_session": False})
+
+def _run(*statements) -> int:
+    with Session(engine) as session:
+        count = sum(_execute(session, statement).rowcount for statement in statements)
+        session.commit()
+        return count
+
+def toggle_tasks(worklist_id, ranges:IdRanges=None) -> int:
+    """Flips completed of the tasks of a worklist in ranges. Returns how many there were"""
+    return _run(_toggle_tasks(worklist_id, ranges))
+
+def delete_tasks(worklist_id, ranges:IdRanges=None) -> int:
+    return _run(_delete_tasks(worklist_id, ranges))
+
+def delete_worklists(user_id, ranges:IdRanges=None) -> int:
+    return _run(_delete_worklists(user_id, ranges))
+
+def delete_by_id(model:SQLModel, ids:Iterable[int]) -> int:
+    """Deletes the rows of model with these ids, without loading them. Returns how many there were"""
+    return _run(*(_delete_by_id(model, chunk) for chunk in _chunked(ids, BULK_CHUNK_SIZE)))
+
+def set_completed(task_ids:Iterable[int], value:bool) -> int:
+    """Sets completed of the tasks with these ids, without loading them. Returns how many there were"""
+    return _run(*(_set_completed(chunk, value) for chunk in _chunked(task_ids, BULK_CHUNK_SIZE)))
+
+### Repository ###
+class Repository:
+    """A unit of work that a frontend (repl or tui) keeps for its whole life.
+
+    It holds one session, so connections and the identity map are reused and the
+    returned objects stay attached. Wrap everything a command does in `with repo.command():`
+    and its writes go out in a single commit. Calls made outside of a command commit right away.
+    """
+
+    def __init__(self):
+        # we expire what changed ourselves in commit(), not the whole identity map
+        self.session = Session(engine, expire_on_commit=False)
+        self._depth = 0
+
+    @contextmanager
+    def command(self):
+        """Groups all the reads and writes of one command into one transaction"""
+        self._depth += 1
+        try:
+            yield self
+        except Exception:
+            if self._depth == 1:
+                self.session.rollback()
+            raise
+        else:
+            if self._depth == 1:
+                self.commit()
+        finally:
+            self._depth -= 1
+
+    def commit(self):
+        """Commits and expires only the objects that were changed, so they reload on next access"""
+        changed = list(self.session.dirty)
+        self.session.commit()
+        for entity in changed:
+            if entity in self.session:
+                self.session.expire(entity)
+
+    def close(self):
+        self.session.close()
+
+    def _done(self):
+        # outside of a command every call is its own transaction. This also ends read
+        # transactions, otherwise WAL would keep showing us an old snapshot of the db
+        if self._depth == 0:
+            self.commit()
+
+    def _all(self, query) -> List:
+        # populate_existing refreshes objects already in the identity map with what is in the db now
+        items = list(query.execution_options(populate_existing=True))
+        self._done()
+        return items
+
+    def get_users(self) -> List[User]:
+        return self._all(self.session.query(User))
+
+    def get_worklists(self, user_id=1) -> List[Worklist]:
+        return self._all(self.session.query(Worklist).where(Worklist.user_id == user_id).order_by(Worklist.id))
+
+    def get_tasks(self, worklist_id=1) -> List[Task]:
+        return self._all(self.session.query(Task).where(Task.worklist_id == worklist_id).order_by(Task.id))
+
+    def get_worklists_page(self, user_id=1, after_id:Optional[int]=None, before_id:Optional[int]=None, limit:int=PAGE_SIZE) -> List[Worklist]:
+        items = _page(self.session.query(Worklist).where(Worklist.user_id == user_id), Worklist, after_id, before_id, limit)
+        self._done()
+        return items
+
+    def get_tasks_page(self, worklist_id=1, after_id:Optional[int]=None, before_id:Optional[int]=None, limit:int=PAGE_SIZE) -> List[Task]:
+        items = _page(self.session.query(Task).where(Task.worklist_id == worklist_id), Task, after_id, before_id, limit)
+        self._done()
+        return items
+
+    def get_worklist_rows(self, user_id=1, after_id:Optional[int]=None, before_id:Optional[int]=None, limit:Optional[int]=None) -> List[WorklistRow]:
+        statement = _select_rows(WorklistRow, Worklist).where(Worklist.user_id == user_id)
+        rows = _rows_page(self.session, WorklistRow, statement, Worklist.id, after_id, before_id, limit)
+        self._done()
+        return rows
+
+    def get_task_rows(self, worklist_id=1, after_id:Optional[int]=None, before_id:Optional[int]=None, limit:Optional[int]=None,
+                      offset:int=0) -> List[TaskRow]:
+        statement = _select_rows(TaskRow, Task).where(Task.worklist_id == worklist_id)
+        rows = _rows_page(self.session, TaskRow, statement, Task.id, after_id, before_id, limit, offset)
+        self._done()
+        return rows
+
+    def count_tasks(self, worklist_id=1) -> int:
+        count = self.session.execute(_count_tasks(worklist_id)).scalar_one()
+        self._done()
+        return count
+
+    def get_worklist_summaries(self, user_id=1, after_id:Optional[int]=None, before_id:Optional[int]=None, limit:Optional[int]=None,
+                               offset:int=0) -> List[WorklistSummary]:
+        rows = _rows_page(self.session, WorklistSummary, _select_worklist_summaries(user_id), Worklist.id, after_id, before_id, limit, offset)
+        self._done()
+        return rows
+
+    def count_worklists(self, user_id=1) -> int:
+        count = self.session.execute(_count_worklists(user_id)).scalar_one()
+        self._done()
+        return count
+
+    def search_tasks(self, user_id, query:str, limit:int=20) -> List[TaskRow]:
+        rows = _search_tasks(self.session, user_id, query, limit)
+        self._done()
+        return rows
+
+    def get_tasks_between(self, user_id, start:Optional[date]=None, end:Optional[date]=None, limit:int=100) -> List[TaskRow]:
+        rows = list(map(TaskRow._make, self.session.execute(_select_tasks_between(user_id, start, end, limit))))
+        self._done()
+        return rows
+
+    def get_stale_tasks(self, days:int, user_id=None, limit:int=100) -> List[TaskRow]:
+        rows = list(map(TaskRow._make, self.session.execute(_select_stale_tasks(days, user_id, limit))))
+        self._done()
+        return rows
+
+    def get_entity(self, model:SQLModel, id):
+        entity = self.session.get(model, id)
+        self._done()
+        return entity
+
+    def add(self, entity):
+        """Adds a new entity. The id is available right after"""
+        self.session.add(entity)
+        self.session.flush()
+        self._done()
+        return entity
+
+    def create_worklist(self, name:str, date_created:Union[str, date]=None, user_id:Optional[int]=None) -> Worklist:
+        return self.add(create_worklist(name, date_created, user_id=user_id, save=False))
+
+    def create_task(self, task:str, date_created:Union[str, date]=None, completed:bool=False, worklist_id:Optional[int]=None) -> Task:
+        return self.add(create_task(task, date_created, completed, worklist_id=worklist_id, save=False))
+
+    def create_tasks(self, tasks:Iterable[Union[str, dict, Task]], worklist_id:Optional[int]=None) -> List[TaskRow]:
+        """Creates many tasks with one insert"""
+        rows = list(_task_rows(tasks, worklist_id))
+        if rows:
+            _insert_chunk(self.session, Task, rows)
+        self._done()
+        return [TaskRow(**{field: row[field] for field in TaskRow._fields}) for row in rows]
+
+    def _run(self, *statements) -> int:
+        count = sum(_execute(self.session, statement).rowcount for statement in statements)
+        self._done()
+        return count
+
+    def toggle_tasks(self, worklist_id, ranges:IdRanges=None) -> int:
+        return self._run(_toggle_tasks(worklist_id, ranges))
+
+    def delete_tasks(self, worklist_id, ranges:IdRanges=None) -> int:
+        return self._run(_delete_tasks(worklist_id, ranges))
+
+    def delete_worklists(self, user_id, ranges:IdRanges=None) -> int:
+        return self._run(_delete_worklists(user_id, ranges))
+
+    def delete_by_id(self, model:SQLModel, ids:Iterable[int]) -> int:
+        return self._run(*(_delete_by_id(model, chunk) for chunk in _chunked(ids, BULK_CHUNK_SIZE)))
+
+    def set_completed(self, task_ids:Iterable[int], value:bool) -> int:
+        return self._run(*(_set_completed(chunk, value) for chunk in _chunked(task_ids, BULK_CHUNK_SIZE)))
+
 def create_fake_data():
     user_1 = create_user("Jeremy", "Castagno")
     worklist_1 = create_worklist("Priority", user_id=user_1.id)
     create_task("Get eggs", worklist_id=worklist_1.id)
     create_task("Get protein powder", worklist_id=worklist_1.id)
 
-def create_db_and_tables():  # 
-    """This creates our tables and add some fake data"""
+def create_indexes():
+    """Adds any missing indexes to an existing database. Nothing is dropped"""
+    for table in SQLModel.metadata.sorted_tables:
+        for index in table.indexes:
+            index.create(engine, checkfirst=True)
+
+def normalize_dates(connection):
+    """Older versions stored str(date.today()), already the way sqlite keeps a DATE. Dates written
+    any other way sqlite understands (with a time, say) are rewritten like that, so they compare right"""
+    for model in (Worklist, Task):
+        connection.exec_driver_sql(f"UPDATE {model.__tablename__} SET date_created = date(date_created) "
+                                   "WHERE date_created != date(date_created)")
+
+def explain_query_plan(statement) -> List[str]:
+    """Returns the sqlite query plan of a statement (or a session.query), one line per step"""
+    statement = getattr(statement, 'statement', statement)
+    sql = str(statement.compile(engine, compile_kwargs={"literal_binds": True}))
+    with engine.connect() as connection:
+        return [row[-1] for row in connection.exec_driver_sql(f"EXPLAIN QUERY PLAN {sql}")]
+
+def create_db_and_tables(keep_data:bool=False):  # 
+    """This creates our tables and add some fake data
+    If keep_data is True, existing tables are kept and only missing tables, indexes and the search index are added,
+    and the dates are normalized
+    """
+    if keep_data:
+        with engine.connect() as connection:
+            complete = has_search_index(connection)
+        SQLModel.metadata.create_all(engine)
+        create_indexes()
+        with engine.begin() as connection:
+            # tasks added while a trigger was missing are not in the index, they all get indexed again
+            create_search_index(connection, rebuild=not complete)
+            normalize_dates(connection)
+        return
     SQLModel.metadata.drop_all(engine)  # 
     SQLModel.metadata.create_all(engine)  # 
     create_fake_data()
 
+@click.command()
+@click.option("--upgrade", is_flag=True, help="Add missing tables and indexes (search included) to the existing database, keeping its data")
+@click.option("--users", type=click.IntRange(min=1), help="Fill the database with this many synthetic users instead of the demo data")
+@click.option("--worklists-per-user", type=click.IntRange(min=0), default=10, show_default=True, help="Average number of worklists of a synthetic user")
+@click.option("--tasks-per-list", type=click.IntRange(min=0), default=20, show_default=True, help="Average number of tasks of a synthetic worklist")
+@click.option("--seed", type=int, default=0, show_default=True, help="The same seed gives the same synthetic data")
+@click.option("--processes", type=click.IntRange(min=1), help="Processes generating synthetic tasks (default: one per cpu)")
+def create_db_cli(upgrade, users, worklists_per_user, tasks_per_list, seed, processes):
+    """Creates the database (todo-create-db)"""
+    if users is None:
+        create_db_and_tables(keep_data=upgrade)
+        return
+    if upgrade:
+        raise click.UsageError("--users creates a new database, it can't be used with --upgrade")
+    from todolist.fake_data import generate_fake_data # only needed here
+    SQLModel.metadata.drop_all(engine)
+    SQLModel.metadata.create_all(engine)
+    start = time.perf_counter()
+    with click.progressbar(length=users * worklists_per_user * tasks_per_list, label="Tasks", file=sys.stderr) as bar:
+        total = generate_fake_data(users, worklists_per_user, tasks_per_list, seed=seed, processes=processes, progress=bar.update)
+    click.echo(f"{users} users, {users * worklists_per_user} worklists and {total} tasks in {time.perf_counter() - start:.1f}s", err=True)
+
 
 
 # Create tables and fake data by: python -m todolist.db
 if __name__ == "__main__":  # 
-    create_db_and_tables()  # 
+    # todolist.fake_data imports todolist.db: it must get this module, importing a second copy
+    # of it would define the tables again
+    sys.modules["todolist.db"] = sys.modules[__name__]
+    create_db_cli()  # 
@@ -0,0 +1,171 @@
+"""Synthetic databases of any size, for trying the apps and the benchmarks on production-like data.
+
+    todo-create-db --users 1000 --worklists-per-user 100 --tasks-per-list 100   # 10M tasks
+
+The counts are averages. Like real data, a few users have many worklists and a few worklists
+are huge, while most are small. The same seed always gives the same database, whatever the
+number of processes.
+
+The tasks are generated by worker processes, in jobs of JOB_SIZE tasks, and loaded by this one
+with plain executemany inserts. The secondary indexes and the search index are dropped while
+loading and built again at the end, which is much faster than keeping them up to date row by row.
+"""
+import os
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+from datetime import date, timedelta
+from random import Random
+from typing import Callable, Iterator, List, Optional, Sequence, Tuple
+
+from sqlmodel import SQLModel
+
+from todolist import db
+from todolist.db import User, Worklist, Task
+
+JOB_SIZE = 50_000 # tasks generated by a worker at a time, and inserted in one transaction
+WORKLIST_SKEW = 1.0 # sigma of the lognormal the sizes are drawn from, the bigger the more skewed
+TASK_SKEW = 1.5
+# the data ends on a fixed day, so a seed gives the same dates whenever it is run
+END_DATE = date(2024, 12, 31)
+DAYS = 3 * 365 # the oldest worklist is this many days older than END_DATE
+
+FIRST_NAMES = ["Ada", "Alan", "Grace", "Linus", "Margaret", "Dennis", "Barbara", "Ken", "Frances", "Guido",
+               "Radia", "Edsger", "Katherine", "Donald", "Hedy", "John", "Sophie", "Tim", "Anita", "Bjarne"]
+LAST_NAMES = ["Lovelace", "Turing", "Hopper", "Torvalds", "Hamilton", "Ritchie", "Liskov", "Thompson", "Allen",
+              "van Rossum", "Perlman", "Dijkstra", "Johnson", "Knuth", "Lamarr", "Backus", "Wilson", "Berners-Lee"]
+LIST_NAMES = ["Groceries", "Work", "Home", "Errands", "Garden", "Travel", "Reading", "Gifts", "Car", "Health",
+              "Bills", "Side project", "Weekend", "Kids", "Chores", "Ideas", "Fitness", "Study", "Wedding", "Move"]
+VERBS = ["Buy", "Call", "Fix", "Write", "Clean", "Book", "Pay", "Email", "Read", "Plan", "Return", "Order",
+         "Check", "Send", "Update", "Review", "Pick up", "Cancel", "Schedule", "Water", "Renew", "Wash"]
+THINGS = ["milk", "eggs", "bread", "the report", "the kitchen", "a flight", "rent", "the plants", "the boss",
+          "the dentist", "the car", "insurance", "tickets", "the bug", "the invoice", "the garage", "a present",
+          "the passport", "the laundry", "coffee", "the slides", "the roof", "batteries", "the library books"]
+EXTRAS = ["", "", "", " today", " tomorrow", " before friday", " for mom", " with Sam", " again", " asap",
+          " this weekend", " after work", " (urgent)", " if there is time"]
+
+WorklistPlan = Tuple[int, int, int, int, int] # worklist id, user id, day, first task id, number of tasks
+Job = List[Tuple[int, int, int, int]] # (worklist id, day, first task id, number of tasks) of some worklists
+
+# every task text there can be, one random() picks one (three rng.choice calls are much slower)
+_TEXTS = [f"{verb} {thing}{extra}" for verb in VERBS for thing in THINGS for extra in EXTRAS]
+_DATES = [(END_DATE - timedelta(days=DAYS - day)).isoformat() for day in range(DAYS + 1)]
+
+
+def skewed_sizes(rng:Random, count:int, total:int, skew:float) -> List[int]:
+    """count sizes that add up to exactly total. Drawn from a lognormal: a few are huge, most are small"""
+    weights = [rng.lognormvariate(0, skew) for _ in range(count)]
+    scale = total / sum(weights) if weights else 0
+    sizes, cumulative, last = [], 0.0, 0
+    for weight in weights:
+        cumulative += weight * scale
+        end = min(round(cumulative), total)
+        sizes.append(end - last)
+        last = end
+    if sizes:
+        sizes[-1] += total - last # what rounding lost
+    return sizes
+
+def plan(users:int, worklists_per_user:int, tasks_per_list:int, seed:int=0) -> Tuple[List[tuple], List[tuple], List[WorklistPlan]]:
+    """The users, worklists and where the tasks of every worklist go, without the tasks themselves"""
+    rng = Random(seed)
+    user_rows = [(user_id, rng.choice(FIRST_NAMES), rng.choice(LAST_NAMES)) for user_id in range(1, users + 1)]
+    worklist_rows, worklists = [], []
+    worklist_counts = skewed_sizes(rng, users, users * worklists_per_user, WORKLIST_SKEW)
+    task_counts = iter(skewed_sizes(rng, sum(worklist_counts), users * worklists_per_user * tasks_per_list, TASK_SKEW))
+    worklist_id, task_id = 1, 1
+    for user_id, count in enumerate(worklist_counts, 1):
+        for _ in range(count):
+            day = rng.randrange(DAYS + 1)
+            tasks = next(task_counts)
+            worklist_rows.append((worklist_id, user_id, rng.choice(LIST_NAMES), _DATES[day]))
+            worklists.append((worklist_id, user_id, day, task_id, tasks))
+            worklist_id += 1
+            task_id += tasks
+    return user_rows, worklist_rows, worklists
+
+def jobs(worklists:Sequence[WorklistPlan], job_size:int=JOB_SIZE) -> Iterator[Job]:
+    """Splits the tasks of the worklists into jobs of job_size tasks. A huge worklist is split over several"""
+    job, size = [], 0
+    for worklist_id, _, day, first_task_id, count in worklists:
+        while count:
+            part = min(count, job_size - size)
+            job.append((worklist_id, day, first_task_id, part))
+            size, first_task_id, count = size + part, first_task_id + part, count - part
+            if size == job_size:
+                yield job
+                job, size = [], 0
+    if job:
+        yield job
+
+def generate_tasks(seed:int, job:Job) -> List[tuple]:
+    """The task rows of a job. Runs in a worker process"""
+    # seeded by the job, not the process, so the tasks don't depend on which process made them
+    rng = Random(f"{seed}:{job[0][2]}")
+    random, texts, n_texts = rng.random, _TEXTS, len(_TEXTS)
+    rows = []
+    for worklist_id, first_day, first_task_id, count in job:
+        days = DAYS - first_day + 1
+        for task_id in range(first_task_id, first_task_id + count):
+            day = first_day + int(random() * days)
+            # the older a task, the more likely it is done
+            completed = random() < 0.2 + 0.7 * (DAYS - day) / DAYS
+            rows.append((task_id, worklist_id, texts[int(random() * n_texts)], _DATES[day], completed))
+    return rows
+
+def _insert_sql(model:SQLModel, columns:Sequence[str]) -> str:
+    return f"INSERT INTO {model.__tablename__} ({', '.join(columns)}) VALUES ({', '.join('?' * len(columns))})"
+
+def _generated(seed:int, all_jobs:Iterator[Job], processes:int) -> Iterator[List[tuple]]:
+    """The task rows of every job in order, made by processes workers while the caller inserts"""
+    if processes <= 1:
+        yield from (generate_tasks(seed, job) for job in all_jobs)
+        return
+    with ProcessPoolExecutor(processes) as executor:
+        # a few jobs ahead of the inserts, not all of them, so memory stays flat
+        pending = deque()
+        for job in all_jobs:
+            pending.append(executor.submit(generate_tasks, seed, job))
+            if len(pending) >= 2 * processes:
+                yield pending.popleft().result()
+        while pending:
+            yield pending.popleft().result()
+
+def generate_fake_data(users:int, worklists_per_user:int=10, tasks_per_list:int=20, seed:int=0,
+                       processes:Optional[int]=None, progress:Optional[Callable[[int], None]]=None) -> int:
+    """Fills the (empty) tables with users * worklists_per_user * tasks_per_list tasks.
+    progress(n) is called after every n tasks are inserted. Returns the number of tasks"""
+    user_rows, worklist_rows, worklists = plan(users, worklists_per_user, tasks_per_list, seed)
+    indexes = [index for model in (Worklist, Task) for index in model.__table__.indexes]
+    with db.engine.connect() as connection:
+        # a fresh database nobody reads yet, it can be rebuilt if the machine dies while loading
+        connection.exec_driver_sql("PRAGMA synchronous=OFF")
+        connection.exec_driver_sql("PRAGMA cache_size=-256000")
+        try:
+            for index in indexes:
+                index.drop(connection, checkfirst=True)
+            connection.exec_driver_sql("DROP TRIGGER IF EXISTS task_search_insert")
+            connection.exec_driver_sql(_insert_sql(User, ("id", "first_name", "last_name")), user_rows)
+            connection.exec_driver_sql(_insert_sql(Worklist, ("id", "user_id", "name", "date_created")), worklist_rows)
+            connection.commit()
+
+            insert_task = _insert_sql(Task, ("id", "worklist_id", "task", "date_created", "completed"))
+            total = 0
+            for rows in _generated(seed, jobs(worklists), processes or os.cpu_count() or 1):
+                connection.exec_driver_sql(insert_task, rows)
+                connection.commit()
+                total += len(rows)
+                if progress is not None:
+                    progress(len(rows))
+
+            for index in indexes:
+                index.create(connection)
+            db.create_search_index(connection, rebuild=True) # the trigger too
+            connection.commit()
+        finally:
+            # the connection goes back to the pool, with the settings of the profile again
+            connection.rollback()
+            settings = db.PRAGMA_PROFILES[db.pragma_profile]
+            connection.exec_driver_sql(f"PRAGMA synchronous={settings['synchronous']}")
+            connection.exec_driver_sql(f"PRAGMA cache_size={settings['cache_size']}")
+            connection.commit()
+    return total
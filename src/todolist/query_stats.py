@@ -0,0 +1,175 @@
+"""Counts and times the sql statements the apps run, by the todolist.db function that ran them.
+
+Off unless TODOLIST_STATS is set (to anything but 0), then it costs nothing. When on, every
+statement records its latency in a histogram and the rows it returned (or changed).
+TODOLIST_STATS_FILE=path writes them as JSON when the program exits.
+
+    TODOLIST_STATS=1 TODOLIST_STATS_FILE=stats.json todo-repl
+
+The repl shows them with the `stats` command, the tui with the s key.
+"""
+import atexit
+import json
+import os
+import sqlite3
+import sys
+import threading
+import time
+from typing import Dict, List, Optional, Tuple
+
+from rich.table import Table
+
+ENABLED = os.environ.get("TODOLIST_STATS", "0") not in ("", "0")
+DUMP_FILE = os.environ.get("TODOLIST_STATS_FILE")
+# upper bounds of the latency histogram buckets, in ms. The last bucket holds the slower ones
+BUCKETS_MS = (0.1, 0.25, 0.5, 1, 2.5, 5, 10, 25, 50, 100, 250, 1000)
+
+
+class StatementStats:
+    """Everything recorded for one statement run by one function"""
+    __slots__ = ("calls", "total_ms", "max_ms", "rows", "histogram")
+
+    def __init__(self):
+        self.calls = 0
+        self.total_ms = 0.0
+        self.max_ms = 0.0
+        self.rows = 0
+        self.histogram = [0] * (len(BUCKETS_MS) + 1)
+
+    def add(self, ms:float, rows:int):
+        self.calls += 1
+        self.total_ms += ms
+        self.max_ms = max(self.max_ms, ms)
+        self.rows += rows
+        bucket = 0
+        while bucket < len(BUCKETS_MS) and ms > BUCKETS_MS[bucket]:
+            bucket += 1
+        self.histogram[bucket] += 1
+
+    def percentile(self, fraction:float) -> float:
+        """The upper bound of the bucket the fraction of calls falls in (max_ms for the last one)"""
+        seen = 0
+        for bucket, count in enumerate(self.histogram):
+            seen += count
+            if seen >= fraction * self.calls and count:
+                return BUCKETS_MS[bucket] if bucket < len(BUCKETS_MS) else self.max_ms
+        return 0.0
+
+
+class QueryStats:
+    """The stats of every (function, statement). Statements run on several threads (the tui has
+    a db thread), so changes and snapshots take a lock"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._stats: Dict[Tuple[str, str], StatementStats] = {}
+
+    def record(self, function:str, statement:str, ms:float, rows:int) -> StatementStats:
+        with self._lock:
+            entry = self._stats.get((function, statement))
+            if entry is None:
+                entry = self._stats[(function, statement)] = StatementStats()
+            entry.add(ms, rows)
+            return entry
+
+    def add_rows(self, entry:StatementStats, rows:int):
+        with self._lock:
+            entry.rows += rows
+
+    def reset(self):
+        with self._lock:
+            self._stats.clear()
+
+    def snapshot(self) -> List[dict]:
+        """One dict per (function, statement), the most total time first"""
+        with self._lock:
+            rows = [dict(function=function, statement=statement, calls=entry.calls, total_ms=entry.total_ms,
+                         mean_ms=entry.total_ms / entry.calls, p50_ms=entry.percentile(0.5),
+                         p95_ms=entry.percentile(0.95), max_ms=entry.max_ms, rows=entry.rows,
+                         histogram=dict(zip([f"<={bound}ms" for bound in BUCKETS_MS] + ["slower"], entry.histogram)))
+                    for (function, statement), entry in self._stats.items()]
+        return sorted(rows, key=lambda row: row["total_ms"], reverse=True)
+
+    def dump(self, path):
+        with open(path, "w") as file:
+            json.dump(dict(buckets_ms=BUCKETS_MS, statements=self.snapshot()), file, indent=2)
+
+stats = QueryStats()
+
+if ENABLED and DUMP_FILE:
+    atexit.register(lambda: stats.dump(DUMP_FILE))
+
+
+def stats_table(limit:int=15) -> Table:
+    """The statements that took the most time, as a rich table (the repl and the tui show this)"""
+    rows = stats.snapshot()
+    table = Table(title="Query stats", caption=f"{len(rows)} statements, {sum(row['calls'] for row in rows)} calls"
+                  if ENABLED else "off, start the app with TODOLIST_STATS=1")
+    for column in ("Function", "Statement", "Calls", "Total ms", "Mean ms", "p50 ms", "p95 ms", "Rows"):
+        table.add_column(column, justify="left" if column in ("Function", "Statement") else "right",
+                         style="cyan", no_wrap=column != "Statement")
+    for row in rows[:limit]:
+        statement = " ".join(row["statement"].split())
+        table.add_row(row["function"], statement[:80] + ("..." if len(statement) > 80 else ""), str(row["calls"]),
+                      f"{row['total_ms']:.1f}", f"{row['mean_ms']:.2f}", f"{row['p50_ms']:g}", f"{row['p95_ms']:g}",
+                      str(row["rows"]))
+    return table
+
+
+### Hooks ###
+
+class CountingCursor(sqlite3.Cursor):
+    """Counts the rows fetched into the stats of the statement that made them"""
+    entry: Optional[StatementStats] = None
+
+    def fetchone(self):
+        row = super().fetchone()
+        if row is not None and self.entry is not None:
+            stats.add_rows(self.entry, 1)
+        return row
+
+    def fetchmany(self, *args, **kwargs):
+        rows = super().fetchmany(*args, **kwargs)
+        if self.entry is not None:
+            stats.add_rows(self.entry, len(rows))
+        return rows
+
+    def fetchall(self):
+        rows = super().fetchall()
+        if self.entry is not None:
+            stats.add_rows(self.entry, len(rows))
+        return rows
+
+class CountingConnection(sqlite3.Connection):
+    """Passed to sqlite3.connect(factory=...), its cursors count their rows"""
+
+    def cursor(self, factory=CountingCursor):
+        return super().cursor(factory)
+
+def _calling_function(api_file:str) -> str:
+    """The outermost public function of api_file on the stack: what the app called"""
+    function = None
+    frame = sys._getframe(2)
+    while frame is not None:
+        code = frame.f_code
+        if code.co_filename == api_file and not code.co_name.startswith("_"):
+            function = getattr(code, "co_qualname", code.co_name)
+        frame = frame.f_back
+    return function or "other"
+
+def instrument(engine, api_file:str):
+    """Records the statements run by engine, tagged by the function of api_file (todolist/db.py) that ran them"""
+    from sqlalchemy import event
+
+    @event.listens_for(engine, "before_cursor_execute")
+    def before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+        conn.info.setdefault("query_stats", []).append((time.perf_counter(), _calling_function(api_file)))
+
+    @event.listens_for(engine, "after_cursor_execute")
+    def after_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+        start, function = conn.info["query_stats"].pop()
+        ms = (time.perf_counter() - start) * 1000
+        # rows changed here, rows returned as they are fetched
+        entry = stats.record(function, statement, ms, max(cursor.rowcount, 0))
+        if isinstance(cursor, CountingCursor):
+            cursor.entry = entry
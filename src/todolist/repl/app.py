@@ -1,72 +1,336 @@
 
+import sys
+import time
+from contextlib import nullcontext
 from dataclasses import dataclass, field
-from typing import Optional, List
+from typing import Optional, List, Dict, Iterable, TextIO, Tuple
 from enum import Enum, auto
+import click
 from prompt_toolkit import PromptSession
 from sqlmodel import SQLModel
 
-from todolist.db import (User, Worklist, Task, 
-                         get_users, get_worklists, get_tasks, 
-                         create_worklist, create_task, get_entity, 
-                         update_entity, delete_entity)
-from .console import console
-from .helper import get_item, show_table_and_ask_for_command, Command, EntityNotFound
+from todolist import query_stats
+from todolist.db import User, Worklist, Task, WorklistSummary, TaskRow, Repository, PAGE_SIZE, IdRanges, to_row, \
+    parse_date_filter
+from .console import console, error_console
+from .helper import get_item, show_table_and_ask_for_command, create_table_from_schema, get_column_plan, \
+    write_table_rows, write_tsv_rows, parse_ids, in_ranges, Command, CommandCompleter, EntityNotFound, BadIds, BadCommand
 
 class Step(Enum):
     show_user = auto()
     show_worklist = auto()
     show_task = auto()
 
+# the list that is shown, and the model its commands act on, at every step
+STEP_LISTS = {
+    Step.show_user: ('all_user_list', User),
+    Step.show_worklist: ('all_worklist_list', Worklist),
+    Step.show_task: ('all_tasklist_list', Task),
+}
 
 @dataclass
 class AppState():
     app_step:Step = Step.show_user
     all_user_list: List[User] = field(default_factory=list)
-    all_worklist_list: List[Worklist] = field(default_factory=list)
-    all_tasklist_list: List[Task] = field(default_factory=list)
+    all_worklist_list: List[WorklistSummary] = field(default_factory=list)
+    all_tasklist_list: List[TaskRow] = field(default_factory=list)
     active_user: Optional[User] = None
     active_worklist: Optional[Worklist] = None
+    repo: Optional[Repository] = None
+    # worklists and tasks are shown one page at a time. A page holds the rows with an id after these
+    page_size: int = PAGE_SIZE
+    worklist_page_after: Optional[int] = None
+    task_page_after: Optional[int] = None
+    # where the page starts in the whole list, and the length of the whole list (counted by the db)
+    worklist_page_offset: int = 0
+    task_page_offset: int = 0
+    worklist_total: int = 0
+    task_total: int = 0
+    # the same rows by id
+    users_by_id: Dict[int, User] = field(default_factory=dict)
+    worklists_by_id: Dict[int, WorklistSummary] = field(default_factory=dict)
+    tasks_by_id: Dict[int, TaskRow] = field(default_factory=dict)
+    # set when a change could not be applied to the rows in memory, they are read again before being shown
+    worklists_stale: bool = False
+    tasks_stale: bool = False
+    version: int = 0 # goes up every time the rows change, the completer rebuilds its index then
+    # run_script writes the rows search, filter and stats find there, instead of drawing tables
+    script_output: Optional[TextIO] = None
 
     def __init__(self):
+        self.repo = Repository() # one session for the whole repl
+        self.completer = CommandCompleter(self.completion_items)
+        self.set_worklist_list([])
+        self.set_tasklist_list([])
         self.refresh_users()
 
     def refresh_users(self):
-        self.all_user_list = get_users()
+        self.all_user_list = self.repo.get_users()
+        self.users_by_id = {user.id: user for user in self.all_user_list}
+        self.version += 1
+
+    def set_worklist_list(self, worklists:List[WorklistSummary]):
+        self.all_worklist_list = worklists
+        self.worklists_by_id = {worklist.id: worklist for worklist in worklists}
+        self.worklists_stale = False
+        self.version += 1
+
+    def set_tasklist_list(self, tasks:List[TaskRow]):
+        self.all_tasklist_list = tasks
+        self.tasks_by_id = {task.id: task for task in tasks}
+        self.tasks_stale = False
+        self.version += 1
 
     def refresh_worklist_list(self):
         if self.active_user is not None:
-            self.all_worklist_list = get_worklists(self.active_user.id)
+            self.set_worklist_list(self.repo.get_worklist_summaries(
+                self.active_user.id, after_id=self.worklist_page_after, limit=self.page_size))
         else:
-            self.all_worklist_list = []
+            self.set_worklist_list([])
 
     def refresh_tasklist_list(self):
         if self.active_worklist is not None:
-            self.all_tasklist_list = get_tasks(self.active_worklist.id)
+            self.set_tasklist_list(self.repo.get_task_rows(
+                self.active_worklist.id, after_id=self.task_page_after, limit=self.page_size))
+        else:
+            self.set_tasklist_list([])
+
+    def completion_items(self):
+        """The (version, rows by id) the completer offers, the rows of the table shown"""
+        items = {Step.show_user: self.users_by_id, Step.show_worklist: self.worklists_by_id,
+                 Step.show_task: self.tasks_by_id}[self.app_step]
+        return (self.app_step, self.version), items
+
+    def refresh_stale(self, model:SQLModel):
+        """Reads the list of model again, only if a change made it out of date"""
+        if model == Worklist and self.worklists_stale:
+            self.refresh_worklist_list()
+        elif model == Task and self.tasks_stale:
+            self.refresh_tasklist_list()
+
+    # The changes made by a command are applied to the rows in memory, so showing the lists
+    # afterwards takes no query. Only the changes that can't be worked out make a list stale
+
+    def page_caption(self, model:SQLModel) -> Optional[str]:
+        if model == Worklist:
+            offset, count, total = self.worklist_page_offset, len(self.all_worklist_list), self.worklist_total
+        elif model == Task:
+            offset, count, total = self.task_page_offset, len(self.all_tasklist_list), self.task_total
+        else:
+            return None
+        if total <= count:
+            return f"{total} in total"
+        return f"{offset + 1}-{offset + count} of {total} (next, prev, head, tail)"
+
+    def _replace_worklist(self, worklist:WorklistSummary, **changes):
+        self.version += 1
+        new_worklist = worklist._replace(**changes)
+        self.all_worklist_list[self.all_worklist_list.index(worklist)] = new_worklist
+        self.worklists_by_id[worklist.id] = new_worklist
+
+    def worklist_added(self, worklist:Worklist):
+        self.version += 1
+        # new worklists come last, so it is only on this page if it is the last one (it is not full)
+        if self.active_user is not None and worklist.user_id == self.active_user.id \
+                and len(self.all_worklist_list) < self.page_size:
+            row = WorklistSummary(worklist.id, worklist.user_id, worklist.name, worklist.date_created, 0, 0, None)
+            self.all_worklist_list.append(row)
+            self.worklists_by_id[row.id] = row
+        self.worklist_total += 1
+
+    def worklists_removed(self, ranges:IdRanges, count:int):
+        """count worklists of the active user with ids in ranges were deleted"""
+        self.version += 1
+        removed = [worklist for worklist in self.all_worklist_list if in_ranges(worklist.id, ranges)]
+        page_was_full = len(self.all_worklist_list) == self.page_size
+        self.set_worklist_list([w for w in self.all_worklist_list if not in_ranges(w.id, ranges)])
+        if removed and page_was_full:
+            # worklists of the next page move up into this one. Set after set_worklist_list, which clears it
+            self.worklists_stale = True
+        self.worklist_total -= count
+        if self.active_worklist is not None and in_ranges(self.active_worklist.id, ranges):
+            self.active_worklist = None
+            self.set_tasklist_list([])
+            self.task_total = 0
+
+    def task_added(self, task:Task):
+        self.version += 1
+        if self.active_worklist is not None and task.worklist_id == self.active_worklist.id \
+                and len(self.all_tasklist_list) < self.page_size:
+            row = to_row(task)
+            self.all_tasklist_list.append(row)
+            self.tasks_by_id[row.id] = row
+        if self.active_worklist is not None and task.worklist_id == self.active_worklist.id:
+            self.task_total += 1
+        worklist = self.worklists_by_id.get(task.worklist_id)
+        if worklist is not None:
+            self._replace_worklist(worklist, total=worklist.total + 1, completed=worklist.completed + task.completed,
+                                   last_task_created=max(worklist.last_task_created or task.date_created, task.date_created))
+
+    def _tasks_shown(self, ranges:IdRanges) -> List[TaskRow]:
+        """The rows of the page with ids in ranges. A single id is looked up, the page is not scanned"""
+        if ranges is not None and len(ranges) == 1 and ranges[0][0] == ranges[0][1]:
+            task = self.tasks_by_id.get(ranges[0][0])
+            return [] if task is None else [task]
+        return [task for task in self.all_tasklist_list if in_ranges(task.id, ranges)]
+
+    def tasks_removed(self, ranges:IdRanges, count:int):
+        """count tasks of the active worklist with ids in ranges were deleted"""
+        self.version += 1
+        removed = self._tasks_shown(ranges)
+        page_was_full = len(self.all_tasklist_list) == self.page_size
+        ids = {task.id for task in removed}
+        self.set_tasklist_list([task for task in self.all_tasklist_list if task.id not in ids])
+        if removed and page_was_full:
+            self.tasks_stale = True # tasks of the next page move up into this one
+        self.task_total -= count
+        worklist = self.worklists_by_id.get(self.active_worklist.id)
+        if worklist is None:
+            return
+        last_task_created = worklist.last_task_created if worklist.total > count else None
+        if len(removed) < count or (last_task_created is not None and last_task_created in [t.date_created for t in removed]):
+            # removed tasks that are not in memory, or maybe the newest one: the counts take a query
+            self.worklists_stale = True
+        self._replace_worklist(worklist, total=worklist.total - count,
+                               completed=worklist.completed - sum(task.completed for task in removed),
+                               last_task_created=last_task_created)
+
+    def tasks_toggled(self, ranges:IdRanges, count:int):
+        """count tasks of the active worklist with ids in ranges had completed flipped"""
+        self.version += 1
+        toggled = self._tasks_shown(ranges)
+        ids = {task.id for task in toggled}
+        self.set_tasklist_list([task._replace(completed=not task.completed) if task.id in ids else task
+                                for task in self.all_tasklist_list])
+        worklist = self.worklists_by_id.get(self.active_worklist.id)
+        if worklist is None:
+            return
+        if len(toggled) < count:
+            self.worklists_stale = True # tasks of other pages were toggled, we don't know which way
         else:
-            self.all_tasklist_list = []
+            self._replace_worklist(worklist, completed=worklist.completed + sum(-1 if t.completed else 1 for t in toggled))
 
     def set_active_user(self, id:int):
-        self.active_user = get_item(id, self.all_user_list, model=User)
+        self.active_user = get_item(id, self.users_by_id, model=User)
+        self.worklist_page_after, self.worklist_page_offset = None, 0
+        self.worklist_total = self.repo.count_worklists(self.active_user.id)
         self.refresh_worklist_list()
 
     def set_active_worklist(self, id:int):
-        self.active_worklist = get_item(id, self.all_worklist_list, model=Worklist)
+        try:
+            self.active_worklist = get_item(id, self.worklists_by_id, model=Worklist)
+        except EntityNotFound:
+            # it may be on another page
+            worklist = self.repo.get_entity(Worklist, int(id))
+            if worklist is None or worklist.user_id != self.active_user.id:
+                raise
+            self.active_worklist = worklist
+        self.task_page_after, self.task_page_offset = None, 0
+        # a worklist from the page shown already has its number of tasks
+        total = getattr(self.active_worklist, 'total', None)
+        self.task_total = total if total is not None else self.repo.count_tasks(self.active_worklist.id)
         self.refresh_tasklist_list()
 
+    def next_page(self, model:SQLModel):
+        """Moves to the page after the one shown. Stays put on the last page"""
+        if model == Worklist and self.all_worklist_list:
+            last_id = self.all_worklist_list[-1].id
+            page = self.repo.get_worklist_summaries(self.active_user.id, after_id=last_id, limit=self.page_size)
+            if page:
+                self.worklist_page_after = last_id
+                self.worklist_page_offset += len(self.all_worklist_list)
+                self.set_worklist_list(page)
+                return
+        elif model == Task and self.all_tasklist_list:
+            last_id = self.all_tasklist_list[-1].id
+            page = self.repo.get_task_rows(self.active_worklist.id, after_id=last_id, limit=self.page_size)
+            if page:
+                self.task_page_after = last_id
+                self.task_page_offset += len(self.all_tasklist_list)
+                self.set_tasklist_list(page)
+                return
+        console.print("[warning]No more pages")
+
+    def prev_page(self, model:SQLModel):
+        """Moves to the page before the one shown"""
+        if model == Worklist and self.worklist_page_after is not None:
+            page = self.repo.get_worklist_summaries(
+                self.active_user.id, before_id=self.worklist_page_after + 1, limit=self.page_size)
+            # a short page means we reached the start of the list
+            self.worklist_page_after = page[0].id - 1 if len(page) == self.page_size else None
+            self.worklist_page_offset = self.worklist_page_offset - len(page) if self.worklist_page_after is not None else 0
+            self.refresh_worklist_list()
+        elif model == Task and self.task_page_after is not None:
+            page = self.repo.get_task_rows(
+                self.active_worklist.id, before_id=self.task_page_after + 1, limit=self.page_size)
+            self.task_page_after = page[0].id - 1 if len(page) == self.page_size else None
+            self.task_page_offset = self.task_page_offset - len(page) if self.task_page_after is not None else 0
+            self.refresh_tasklist_list()
+        else:
+            console.print("[warning]Already on the first page")
+
+    def first_page(self, model:SQLModel):
+        if model == Worklist and self.active_user is not None:
+            self.worklist_page_after, self.worklist_page_offset = None, 0
+            self.refresh_worklist_list()
+        elif model == Task and self.active_worklist is not None:
+            self.task_page_after, self.task_page_offset = None, 0
+            self.refresh_tasklist_list()
+
+    def last_page(self, model:SQLModel):
+        """Moves to the last page_size rows of the list, found by offset from the total"""
+        if model == Worklist and self.active_user is not None:
+            offset = max(self.worklist_total - self.page_size, 0)
+            page = self.repo.get_worklist_summaries(self.active_user.id, offset=offset, limit=self.page_size)
+            self.worklist_page_after = page[0].id - 1 if page and offset else None
+            self.worklist_page_offset = offset
+            self.set_worklist_list(page)
+        elif model == Task and self.active_worklist is not None:
+            offset = max(self.task_total - self.page_size, 0)
+            page = self.repo.get_task_rows(self.active_worklist.id, offset=offset, limit=self.page_size)
+            self.task_page_after = page[0].id - 1 if page and offset else None
+            self.task_page_offset = offset
+            self.set_tasklist_list(page)
+
 def execute_command(session:PromptSession, state:AppState, state_key:str, model:SQLModel):
-    
+    state.refresh_stale(model)
     response = show_table_and_ask_for_command(session, state, state_key, model)
+    return run_response(state, model, response)
+
+def run_response(state:AppState, model:SQLModel, response:str):
+    """Runs one line typed by the user (or read from a script). Returns False when it asks to quit"""
     if len(response.split(' ')) < 2:
         # user wants to quit
         if response == Command.quit:
             return False # return false to make the program exit
+        # user wants to see another page
+        if response in (Command.next, Command.prev, Command.head, Command.tail):
+            with state.repo.command():
+                if response == Command.next:
+                    state.next_page(model)
+                elif response == Command.prev:
+                    state.prev_page(model)
+                elif response == Command.head:
+                    state.first_page(model)
+                else:
+                    state.last_page(model)
+            return True
+        # the time the statements took so far, when TODOLIST_STATS is on
+        if response == Command.stats:
+            show_stats(state)
+            return True
         # user just entered a bad command
-        # warn them and then loop again
-        console.print("[danger]You must type in a command and a value: Eg. 'select 1'")
-        return True
+        raise BadCommand("You must type in a command and a value: Eg. 'select 1'")
 
     command, value = response.split(' ', 1)
     command = command.lower()
+    # everything the command reads and writes goes out in one transaction
+    with state.repo.command():
+        run_command(state, model, command, value)
+    return True
+
+def run_command(state:AppState, model:SQLModel, command:str, value:str):
+    repo = state.repo
     if command == Command.select:
         if model == User:
             state.set_active_user(value)
@@ -76,66 +340,202 @@ def execute_command(session:PromptSession, state:AppState, state_key:str, model:
             state.app_step = Step.show_task
     elif command == Command.remove:
         if model == User:
-            console.print("[warning]Not supported currently")
+            raise BadCommand("Not supported currently")
         elif model == Worklist:
-            if state.active_worklist is not None and state.active_worklist.id == int(value):
-                state.active_worklist = None
+            ranges = parse_ids(value)
+            count = repo.delete_worklists(state.active_user.id, ranges)
+            check_found(value, ranges, count, model, "removed")
+            if state.active_worklist is not None and in_ranges(state.active_worklist.id, ranges):
                 state.app_step = Step.show_worklist
-            delete_entity(get_entity(Worklist, int(value)))
+            state.worklists_removed(ranges, count)
         else:
-            delete_entity(get_entity(Task, int(value)))
+            ranges = parse_ids(value)
+            count = repo.delete_tasks(state.active_worklist.id, ranges)
+            check_found(value, ranges, count, model, "removed")
+            state.tasks_removed(ranges, count)
     elif command == Command.complete:
         if model == Task:
-            task:Task = get_entity(Task, int(value))
-            task.completed = not task.completed
-            update_entity(task)
+            ranges = parse_ids(value)
+            # flips every task, like completing them one at a time
+            count = repo.toggle_tasks(state.active_worklist.id, ranges)
+            check_found(value, ranges, count, model, "toggled")
+            state.tasks_toggled(ranges, count)
         else:
-            console.print("[danger]Not supported")
+            raise BadCommand("Not supported")
     elif command == Command.add:
         if model == Task:
-            create_task(task=value, worklist_id=state.active_worklist.id)
+            # pasting several lines adds a task per line, with one insert
+            lines = [line.strip() for line in value.splitlines() if line.strip()]
+            if len(lines) > 1:
+                for task in repo.create_tasks(lines, worklist_id=state.active_worklist.id):
+                    state.task_added(task)
+            else:
+                state.task_added(repo.create_task(task=value.strip(), worklist_id=state.active_worklist.id))
         elif model == Worklist:
-            create_worklist(name=value, user_id=state.active_user.id)
+            state.worklist_added(repo.create_worklist(name=value, user_id=state.active_user.id))
+        else:
+            raise BadCommand("Not supported")
+    elif command == Command.search:
+        if state.active_user is None:
+            console.print("[warning]Select a user first")
         else:
-            console.print("[danger]Not supported")
+            results = repo.search_tasks(state.active_user.id, value)
+            show_rows(state, Task, results, title=f"Tasks matching '{value}'")
+    elif command == Command.filter:
+        if state.active_user is None:
+            console.print("[warning]Select a user first")
+        else:
+            try:
+                date_filter = parse_date_filter(value)
+            except ValueError as e:
+                raise BadCommand(str(e))
+            if date_filter.stale_days is not None:
+                results = repo.get_stale_tasks(date_filter.stale_days, user_id=state.active_user.id)
+                title = f"Tasks open for more than {date_filter.stale_days} days"
+            else:
+                results = repo.get_tasks_between(state.active_user.id, date_filter.since, date_filter.until)
+                title = f"Tasks created {value}"
+            show_rows(state, Task, results, title=title)
     elif command == Command.reset:
         if value == "worklist":
             state.app_step = Step.show_worklist
         elif value == "user":
             state.app_step = Step.show_user
+    elif command == Command.stats:
+        if value != "reset":
+            raise BadCommand("Only 'stats reset' is supported")
+        query_stats.stats.reset()
+        console.print("[success]Query stats reset")
     else:
-        console.print("[danger]Unknown command")
-    if state.active_user:
-        state.refresh_worklist_list()
-    if state.active_worklist:
-        state.refresh_tasklist_list()
-    return True
+        raise BadCommand("Unknown command")
+
+def show_rows(state:AppState, model:SQLModel, rows:List, title:str):
+    if state.script_output is not None:
+        write_table_rows(state.script_output, model, rows)
+        return
+    console.print(create_table_from_schema(model, rows, title=title))
+    console.print()
+
+STATS_COLUMNS = ("function", "statement", "calls", "total_ms", "mean_ms", "p50_ms", "p95_ms", "rows")
+
+def show_stats(state:AppState):
+    if not query_stats.ENABLED:
+        console.print("[warning]Query stats are off, start todo-repl with TODOLIST_STATS=1")
+        return
+    if state.script_output is not None:
+        rows = [dict(row, statement=" ".join(row["statement"].split())) for row in query_stats.stats.snapshot()]
+        write_tsv_rows(state.script_output, ([row[column] for column in STATS_COLUMNS] for row in rows))
+        return
+    console.print(query_stats.stats_table())
+    console.print()
+
+def check_found(value:str, ranges:IdRanges, count:int, model:SQLModel, done:str):
+    """Commands on many rows say how many there were, a single id that matched nothing is an error"""
+    if ranges is not None and len(ranges) == 1 and ranges[0][0] == ranges[0][1]:
+        if count == 0:
+            raise EntityNotFound(value, model)
+    else:
+        console.print(f"[success]{done.capitalize()} {count} {get_column_plan(model)[0].lower()}(s)")
+
+class _Rollback(Exception):
+    pass
+
+def script_commands(lines:Iterable[str]) -> Iterable[Tuple[int, str]]:
+    """(line number, command) of every line that is not empty or a # comment"""
+    for number, line in enumerate(lines, 1):
+        line = line.strip()
+        if line and not line.startswith('#'):
+            yield number, line
+
+def run_script(state:AppState, lines:Iterable[str], atomic:bool=False) -> int:
+    """Runs commands without prompting or drawing tables, for cron jobs and pipelines.
+
+    Every command gets a tab separated line on stdout: line number, exit code (0 done, 1 bad
+    command, 2 crashed), milliseconds taken and the command. The rows search, filter and stats
+    find come right before it, one tab separated line each that starts with an empty field.
+    Errors and a summary go to stderr.
+    With atomic all the commands are one transaction, rolled back when one of them fails.
+    Returns the highest exit code.
+    """
+    out = sys.stdout
+    codes = [0]
+    start = time.perf_counter()
+    console.quiet = True # the messages commands print for people
+    state.script_output = out
+    try:
+        with state.repo.command() if atomic else nullcontext():
+            for number, response in script_commands(lines):
+                began = time.perf_counter()
+                code, keep_going = 0, True
+                try:
+                    _, model = STEP_LISTS[state.app_step]
+                    state.refresh_stale(model)
+                    keep_going = run_response(state, model, response)
+                except (EntityNotFound, BadIds, BadCommand) as e:
+                    code = 1
+                    error_console.print(f"line {number}: {e}")
+                except Exception:
+                    code = 2
+                    error_console.print(f"line {number}:")
+                    error_console.print_exception()
+                out.write(f"{number}\t{code}\t{(time.perf_counter() - began) * 1000:.3f}\t{response}\n")
+                codes.append(code)
+                if code and atomic:
+                    raise _Rollback()
+                if not keep_going:
+                    break
+    except _Rollback:
+        error_console.print("[danger]Rolled back, no command of the script was saved")
+    finally:
+        console.quiet = False
+        state.script_output = None
+        out.flush()
+    elapsed = time.perf_counter() - start
+    count, failed = len(codes) - 1, sum(code != 0 for code in codes)
+    error_console.print(f"{count} commands, {failed} failed, in {elapsed:.3f}s ({count / elapsed if elapsed else 0:.0f} commands/s)")
+    return max(codes)
+
+@click.command()
+@click.option("--script", type=click.File("r"), help="Run the commands in this file (- for stdin) instead of prompting. Piped input is run the same way")
+@click.option("--atomic", is_flag=True, help="Run the whole script in one transaction, nothing is saved if a command fails")
+def cli(script, atomic):
+    """The todolist repl (todo-repl)"""
+    if script is None and not sys.stdin.isatty():
+        script = sys.stdin # todo-repl < commands.txt
+    if script is not None:
+        state = AppState()
+        try:
+            code = run_script(state, script, atomic=atomic)
+        finally:
+            state.repo.close()
+        sys.exit(code)
+    if atomic:
+        raise click.UsageError("--atomic needs a script, from --script or piped in")
 
-def cli():
     state = AppState() # contains our app sate
     session = PromptSession() # allows us to prompt the user
 
     console.print("You can exit the program by pressing [success]CTRL+D[/success] at anytime")
     console.print("You must type in a command and a value: Eg. 'select 1', 'complete 1'")
+    console.print("Long lists are shown one page at a time, use 'next' and 'prev' to move between pages, 'head' and 'tail' to go to the first and last one")
+    console.print("Find tasks in any of your worklists with 'search <words>'")
+    console.print("complete and remove take ranges too: 'complete 1-5', 'remove 3,7,9-20', 'complete all'")
     console.print()
     loop = True
     while loop:
         try:
-            if state.app_step == Step.show_user:
-                loop = execute_command(session, state, 'all_user_list', model=User)
-            elif state.app_step == Step.show_worklist:
-                loop = execute_command(session, state, 'all_worklist_list', model=Worklist)
-            elif state.app_step == Step.show_task:
-                loop = execute_command(session, state, 'all_tasklist_list', model=Task)
+            state_key, model = STEP_LISTS[state.app_step]
+            loop = execute_command(session, state, state_key, model=model)
         except KeyboardInterrupt:
             continue
         except EOFError:
             break
-        except EntityNotFound as e:
+        except (EntityNotFound, BadIds, BadCommand) as e:
             console.print(f"{e}\n")
         except Exception:
             console.print_exception()
             
+    state.repo.close()
     console.print('GoodBye!')
 
 
@@ -7,4 +7,5 @@ custom_theme = Theme({
     "danger": "bold red",
     "success": "bold green"
 })
-console = Console(theme=custom_theme)
\ No newline at end of file
+console = Console(theme=custom_theme)
+error_console = Console(theme=custom_theme, stderr=True) # messages of todo-repl --script, stdout has the results
@@ -1,14 +1,17 @@
 from enum import Enum
-from prompt_toolkit.completion import NestedCompleter
+from functools import lru_cache
+from bisect import bisect_left
+from itertools import islice, takewhile
+from prompt_toolkit.completion import Completer, Completion
 from sqlmodel import SQLModel
-from typing import List
+from typing import Callable, Dict, Iterable, List, Optional, Tuple
 from rich.table import Table
 
 from .console import console
 
 class EntityNotFound(Exception):
     def __init__(self, id, model:SQLModel):
-        message = f"id={id} not found in {model.schema()['title']} table"        
+        message = f"id={id} not found in {get_column_plan(model)[0]} table"
         super().__init__(message)
         self.id = id
         self.model = model
@@ -16,65 +19,175 @@ class EntityNotFound(Exception):
     def __str__(self):
         return f"[danger]EntityNotFound[/danger]: {self.message}"
 
+class BadIds(ValueError):
+    def __init__(self, value:str):
+        super().__init__(value)
+        self.value = value
+    def __str__(self):
+        return f"[danger]Bad ids[/danger]: '{self.value}', use ids like 5, 1-500, 3,7,9-20 or all"
+
+class BadCommand(ValueError):
+    def __str__(self):
+        return f"[danger]{self.args[0]}"
+
 class Command(str, Enum):
     select = 'select'
     remove = 'remove'
     complete = 'complete'
     add = 'add'
     reset = "reset"
+    search = 'search'
+    filter = 'filter'
+    next = 'next'
+    prev = 'prev'
+    head = 'head'
+    tail = 'tail'
+    stats = 'stats'
     quit = 'quit'
 
-def generate_completer(items):
-    ids = get_ids(items)
-    ids = dict(zip(ids, [None]*len(ids)))
-    completer = NestedCompleter.from_nested_dict({
-        'select': ids,
-        'remove': ids,
-        'complete': ids,
-        'add': None,
-        'reset': dict(user=None, worklist=None),
-        'quit': None
-        })
-    return completer
+ID_COMMANDS = (Command.select, Command.remove, Command.complete)
+MAX_COMPLETIONS = 100
+
+def item_text(item) -> str:
+    """The text a row is known by: the task, the worklist name or the user's name"""
+    if hasattr(item, 'task'):
+        return item.task
+    if hasattr(item, 'name'):
+        return item.name
+    return f"{item.first_name} {item.last_name}"
+
+class CommandCompleter(Completer):
+    """Completes the commands, and the ids of the rows shown for select, remove and complete.
+
+    get_items() returns (version, dict of id -> row) of the rows shown. The sorted ids and the
+    lowercased texts are only built again when the version changed. An id is completed from its
+    prefix with a bisect. Typing some of a row's text instead completes to its id.
+    """
+
+    def __init__(self, get_items:Callable[[], Tuple[int, Dict]]):
+        self.get_items = get_items
+        self._version = None
+        self._ids:List[str] = []
+        self._texts:List[Tuple[str, str, str]] = []
+
+    def _update(self):
+        version, items = self.get_items()
+        if version != self._version:
+            self._version = version
+            self._ids = sorted(str(id) for id in items)
+            self._texts = [(str(id), item_text(item), item_text(item).casefold()) for id, item in items.items()]
+
+    def get_completions(self, document, complete_event):
+        text = document.text_before_cursor.lstrip()
+        if ' ' not in text:
+            for command in Command:
+                if command.value.startswith(text.lower()):
+                    yield Completion(command.value, start_position=-len(text))
+            return
+        command, value = text.split(' ', 1)
+        command = command.lower()
+        if command == Command.reset:
+            for word in ('user', 'worklist'):
+                if word.startswith(value):
+                    yield Completion(word, start_position=-len(value))
+        elif command in ID_COMMANDS:
+            self._update()
+            if value.isdigit() or not value:
+                start = bisect_left(self._ids, value)
+                for id in islice(takewhile(lambda id: id.startswith(value), islice(self._ids, start, None)), MAX_COMPLETIONS):
+                    yield Completion(id, start_position=-len(value))
+            else:
+                words = value.casefold()
+                matches = (row for row in self._texts if words in row[2])
+                for id, label, _ in islice(matches, MAX_COMPLETIONS):
+                    yield Completion(id, start_position=-len(value), display=f"{id} {label}")
 
 def get_item(id, item_list, key="id", model:SQLModel=SQLModel):
+    """Finds the item with this id. item_list can also be a dict of id -> item, then there is no scan"""
+    try:
+        id = int(id)
+    except ValueError:
+        raise BadIds(id) from None
+    if isinstance(item_list, dict):
+        item = item_list.get(id)
+        if item is None:
+            raise EntityNotFound(id, model)
+        return item
     for item in item_list:
-        if int(id) == getattr(item, key):
+        if id == getattr(item, key):
             return item
     raise EntityNotFound(id, model)
 
 
+def parse_ids(value:str) -> Optional[List[Tuple[int, int]]]:
+    """'3,7,9-20' -> [(3, 3), (7, 7), (9, 20)] and 'all' -> None, which means every row"""
+    value = value.strip().lower()
+    if value == 'all':
+        return None
+    ranges = []
+    for part in value.replace(' ', ',').split(','):
+        if part:
+            first, _, last = part.partition('-')
+            try:
+                first, last = int(first), int(last or first)
+            except ValueError:
+                raise BadIds(value) from None
+            ranges.append((min(first, last), max(first, last)))
+    if not ranges:
+        raise BadIds(value)
+    return ranges
+
+def in_ranges(id:int, ranges:Optional[List[Tuple[int, int]]]) -> bool:
+    return ranges is None or any(first <= id <= last for first, last in ranges)
+
 def bp(question: str, suffix:str = ' > '):
     return f"{question}{suffix}"
 
 def get_ids(item_list, to_str=True):
     return [str(item.id) if to_str else item.id for item in item_list]
 
-def create_table_from_schema(item_class:SQLModel, items:List, title:str=None):
-    # get the schema for this model
+@lru_cache(maxsize=None)
+def get_column_plan(item_class:SQLModel, row_fields:Tuple[str, ...]=()) -> Tuple[str, Tuple[Tuple[str, str, bool], ...]]:
+    """The table title and the (field id, column title, no wrap) of every column for this model.
+    model.schema() is slow, so this is only worked out once per model"""
     schema = item_class.schema()
-    title = title if title else schema['title']
     fields = schema['properties']
-    field_ids = list(fields.keys())
+    columns = [(field_id, props["title"], props['type'] != 'string') for field_id, props in fields.items()]
+    # rows like WorklistSummary can carry more fields than the model, show those too
+    columns += [(field_id, field_id.replace('_', ' ').title(), True) for field_id in row_fields if field_id not in fields]
+    return schema['title'], tuple(columns)
+
+def create_table_from_schema(item_class:SQLModel, items:List, title:str=None, caption:str=None):
+    default_title, columns = get_column_plan(item_class, getattr(items[0], '_fields', ()) if items else ())
     # create the table
-    table = Table(title=title)
+    table = Table(title=title if title else default_title, caption=caption)
     # create the table header
-    for _, props in fields.items():
-        no_wrap = False if props['type'] == 'string' else True
-        table.add_column(props["title"], justify="left", style="cyan", no_wrap=no_wrap)
+    for _, column_title, no_wrap in columns:
+        table.add_column(column_title, justify="left", style="cyan", no_wrap=no_wrap)
     # create the table rows
     for item in items:
-        field_values = [str(getattr(item, field_id)) for field_id in field_ids]
-        table.add_row(*field_values)
+        table.add_row(*[str(getattr(item, field_id)) for field_id, _, _ in columns])
     # return our table
     return table
 
+# a tab or a newline in a value would start another field or row
+_TSV_ESCAPES = str.maketrans({"\\": "\\\\", "\t": "\\t", "\n": "\\n"})
+
+def write_tsv_rows(file, rows:Iterable[Iterable]):
+    """Rows as tab separated lines, after an empty first field so they can't be taken for the
+    line of a command (todo-repl --script)"""
+    file.writelines("".join(f"\t{str(value).translate(_TSV_ESCAPES)}" for value in row) + "\n" for row in rows)
+
+def write_table_rows(file, item_class:SQLModel, items:List):
+    """The rows create_table_from_schema would draw, the same columns, with write_tsv_rows"""
+    _, columns = get_column_plan(item_class, getattr(items[0], '_fields', ()) if items else ())
+    write_tsv_rows(file, ([getattr(item, field_id) for field_id, _, _ in columns] for item in items))
+
 def show_table_and_ask_for_command(session, state, state_key, model):
     items = getattr(state, state_key)
-    console.print(create_table_from_schema(model, items))
+    console.print(create_table_from_schema(model, items, caption=state.page_caption(model)))
     
-    completer = generate_completer(items)
-    response = session.prompt(bp("Choose an action"), completer=completer)
+    response = session.prompt(bp("Choose an action"), completer=state.completer)
     console.print()
 
 
@@ -0,0 +1,228 @@
+"""Moving the users, worklists and tasks in and out of the database as JSONL or CSV (todo-export, todo-import).
+
+    todo-export backup.jsonl                  # or - for stdout
+    todo-export --format csv backup/          # user.csv, worklist.csv and task.csv
+    todo-import backup.jsonl                  # or - for stdin
+    todo-import --format csv backup/
+
+Both stream, a chunk of CHUNK_SIZE rows at a time, so memory stays flat whatever the size of the data.
+A JSONL line is one row with its table: {"table": "task", "id": 1, "worklist_id": 1, ...}. The
+tables are written parents first.
+
+Importing into an empty database keeps the ids. Into one with data, every id is moved past the
+biggest id of its table (and every reference by as much), so the imported rows never collide with
+the existing ones and still point to each other. The file must hold the users and worklists its
+rows point to, as an export does. The import is one transaction: a bad row saves nothing.
+Into empty tables, the secondary indexes are dropped and built again once everything is in.
+"""
+import csv
+import json
+import pathlib
+import time
+from itertools import groupby
+from operator import itemgetter
+from typing import Any, Callable, Dict, IO, Iterable, Iterator, List, Optional, Tuple
+
+import click
+from sqlalchemy import Boolean, Integer, Table, func, select
+from sqlalchemy.exc import IntegrityError
+
+from todolist import db
+from todolist.db import User, Worklist, Task
+
+CHUNK_SIZE = 10_000 # rows fetched or inserted at a time
+TABLES: List[Table] = [model.__table__ for model in (User, Worklist, Task)] # parents first
+
+Rows = List[tuple]
+
+
+def _columns(table:Table) -> List[str]:
+    return [column.name for column in table.columns]
+
+def export_rows(connection, table:Table) -> Iterator[Rows]:
+    """The rows of table in chunks, by id. The values are the ones sqlite stores (booleans are 0/1)"""
+    # the driver sql skips sqlalchemy's type processing, sqlite hands out the rows as they are read
+    result = connection.execution_options(stream_results=True).exec_driver_sql(
+        f"SELECT {', '.join(_columns(table))} FROM {table.name} ORDER BY id")
+    yield from result.partitions(CHUNK_SIZE)
+
+def write_jsonl(connection, file:IO) -> Dict[str, int]:
+    encode, counts = json.JSONEncoder().encode, {}
+    for table in TABLES:
+        keys, count = ["table", *_columns(table)], 0
+        booleans = [column.name for column in table.columns if isinstance(column.type, Boolean)]
+        for rows in export_rows(connection, table):
+            lines = []
+            for row in rows:
+                record = dict(zip(keys, (table.name, *row)))
+                for name in booleans:
+                    record[name] = bool(record[name])
+                lines.append(encode(record))
+            file.write("\n".join(lines) + "\n")
+            count += len(rows)
+        counts[table.name] = count
+    return counts
+
+def write_csv(connection, folder:pathlib.Path) -> Dict[str, int]:
+    """One file per table, named after it, with a header row"""
+    folder.mkdir(parents=True, exist_ok=True)
+    counts = {}
+    for table in TABLES:
+        with open(folder / f"{table.name}.csv", "w", newline="") as file:
+            writer, count = csv.writer(file), 0
+            writer.writerow(_columns(table))
+            for rows in export_rows(connection, table):
+                writer.writerows(rows)
+                count += len(rows)
+        counts[table.name] = count
+    return counts
+
+
+def read_jsonl(file:IO) -> Iterator[Tuple[str, dict]]:
+    """(table name, row) of every line"""
+    # CHUNK_SIZE lines are parsed with one loads, as a JSON array, which saves a call per line
+    for lines in db._chunked(file, CHUNK_SIZE):
+        for record in json.loads(f"[{','.join(line for line in lines if not line.isspace())}]"):
+            yield record.pop("table"), record
+
+_TRUE = frozenset(("1", "true", "True"))
+
+def _converter(column) -> Optional[Callable[[str], Any]]:
+    """Makes a CSV value (a string) what the column holds, None for the text columns. JSON values already are"""
+    if isinstance(column.type, Boolean):
+        return _TRUE.__contains__
+    if isinstance(column.type, Integer):
+        return int
+    return None
+
+def read_csv(folder:pathlib.Path) -> Iterator[Tuple[str, dict]]:
+    """(table name, row) of every row of the table files there are in folder"""
+    for table in TABLES:
+        path = folder / f"{table.name}.csv"
+        if not path.exists():
+            continue
+        with open(path, newline="") as file:
+            reader = csv.reader(file)
+            header = next(reader, [])
+            converters = [(name, _converter(table.c[name])) for name in header]
+            converters = [(name, convert) for name, convert in converters if convert is not None]
+            for values in reader:
+                record = dict(zip(header, values))
+                for name, convert in converters:
+                    value = record[name]
+                    record[name] = convert(value) if value else None # an empty value is NULL
+                yield table.name, record
+
+def id_offsets(connection) -> Dict[str, int]:
+    """What the ids of every table are moved by: the biggest id there already is (0 when empty)"""
+    return {table.name: connection.execute(select(func.coalesce(func.max(table.c.id), 0))).scalar_one()
+            for table in TABLES}
+
+def _moved(row:tuple, moves:List[Tuple[int, int]]) -> tuple:
+    row = list(row)
+    for index, move in moves:
+        if row[index] is not None:
+            row[index] += move
+    return tuple(row)
+
+_INSERT_TERMS = "INSERT INTO task_search(rowid, terms) VALUES (?, ?)"
+
+def import_records(connection, records:Iterable[Tuple[str, dict]]) -> Dict[str, int]:
+    """Inserts the records, CHUNK_SIZE at a time, with their ids moved by id_offsets. Doesn't commit"""
+    tables = {table.name: table for table in TABLES}
+    # everything below is one write transaction from here: nobody inserts between id_offsets and
+    # our inserts, and what is dropped below comes back with a rollback, or if the process dies
+    db._lock_for_write(connection)
+    offsets = id_offsets(connection)
+    counts = dict.fromkeys(tables, 0)
+    # into empty tables, the secondary indexes are built once at the end, from all the rows at once,
+    # instead of row by row. With rows already there that would mean indexing them again
+    indexes = [] if offsets[Worklist.__tablename__] or offsets[Task.__tablename__] else \
+        [index for model in (Worklist, Task) for index in model.__table__.indexes]
+    for index in indexes:
+        index.drop(connection, checkfirst=True)
+    # the search terms are computed here and inserted with the tasks, instead of by the insert
+    # trigger calling task_search_terms for every row. A database without the whole search index
+    # (not upgraded yet) gets it at the end, every task indexed
+    indexed = db.has_search_index(connection)
+    connection.exec_driver_sql("DROP TRIGGER IF EXISTS task_search_insert")
+    owners = {} # the user of every imported worklist, for the search terms of its tasks
+    for name, group in groupby(records, key=itemgetter(0)):
+        table = tables.get(name)
+        if table is None:
+            raise click.ClickException(f"Unknown table '{name}'")
+        columns = _columns(table)
+        row_of = itemgetter(*columns)
+        # the id, and the ids of the rows it points to, move with their table
+        moves = [(index, offsets[table.name] if column.primary_key else
+                  offsets[next(iter(column.foreign_keys)).column.table.name])
+                 for index, column in enumerate(table.columns) if column.primary_key or column.foreign_keys]
+        moves = [(index, move) for index, move in moves if move]
+        insert = f"INSERT INTO {table.name} ({', '.join(columns)}) VALUES ({', '.join('?' * len(columns))})"
+        for chunk in db._chunked((record for _, record in group), CHUNK_SIZE):
+            rows = [row_of(record) for record in chunk]
+            if moves:
+                rows = [_moved(row, moves) for row in rows]
+            connection.exec_driver_sql(insert, rows)
+            counts[table.name] += len(rows)
+            if table.name == Worklist.__tablename__:
+                owners.update(map(itemgetter(columns.index("id"), columns.index("user_id")), rows))
+            elif table.name == Task.__tablename__ and indexed:
+                connection.exec_driver_sql(_INSERT_TERMS, _search_terms(rows, columns, owners))
+    for index in indexes:
+        index.create(connection)
+    db.create_search_index(connection, rebuild=not indexed) # the trigger back
+    return counts
+
+def _search_terms(rows:Rows, columns:List[str], owners:Dict[int, Optional[int]]) -> Rows:
+    """(task id, search terms) of the task rows, the way the insert trigger indexes them"""
+    id_, worklist_id, task = (columns.index(name) for name in ("id", "worklist_id", "task"))
+    terms = db.search_terms
+    # a task points to an imported worklist, or the foreign key fails the import
+    return [(row[id_], terms(owners[row[worklist_id]], row[task])) for row in rows if row[worklist_id] in owners]
+
+
+def _report(verb:str, counts:Dict[str, int], seconds:float):
+    total = sum(counts.values())
+    click.echo(f"{verb} {counts['user']} users, {counts['worklist']} worklists and {counts['task']} tasks "
+               f"in {seconds:.1f}s ({total / max(seconds, 1e-9):,.0f} rows/s)", err=True)
+
+FORMAT = click.option("--format", "format_", type=click.Choice(["jsonl", "csv"]), default="jsonl", show_default=True,
+                      help="jsonl: one file (- for stdout/stdin). csv: a folder with a file per table")
+
+@click.command()
+@click.argument("output", default="-")
+@FORMAT
+def export_cli(output, format_):
+    """Writes all users, worklists and tasks to OUTPUT (todo-export)"""
+    start = time.perf_counter()
+    with db.engine.connect() as connection:
+        if format_ == "csv":
+            if output == "-":
+                raise click.UsageError("--format csv needs a folder to write the files to")
+            counts = write_csv(connection, pathlib.Path(output))
+        else:
+            with click.open_file(output, "w") as file:
+                counts = write_jsonl(connection, file)
+    _report("Exported", counts, time.perf_counter() - start)
+
+@click.command()
+@click.argument("input_", metavar="INPUT", default="-")
+@FORMAT
+def import_cli(input_, format_):
+    """Adds the users, worklists and tasks of INPUT to the database, in one transaction (todo-import)"""
+    start = time.perf_counter()
+    if format_ == "csv" and not pathlib.Path(input_).is_dir():
+        raise click.UsageError(f"--format csv reads a folder, {input_} is not one")
+    try:
+        with db.engine.begin() as connection:
+            if format_ == "csv":
+                counts = import_records(connection, read_csv(pathlib.Path(input_)))
+            else:
+                with click.open_file(input_, "r") as file:
+                    counts = import_records(connection, read_jsonl(file))
+    except IntegrityError as e:
+        raise click.ClickException(f"Nothing imported, a row does not fit the database: {e.orig}")
+    except (ValueError, KeyError) as e:
+        raise click.ClickException(f"Nothing imported, bad input: {e!r}")
+    _report("Imported", counts, time.perf_counter() - start)
@@ -1,12 +1,14 @@
+import asyncio
+from collections import OrderedDict
+
+from textual import work
 from textual.app import App, ComposeResult
 from textual.containers import Vertical, Horizontal, Container
 from textual.reactive import reactive
+from textual.widget import Widget
 from textual.widgets import (
     Button,
     Header,
-    Footer,
-    Static,
-    Switch,
     Label,
     ListItem,
     ListView,
@@ -15,80 +17,180 @@ from textual.widgets import (
 from todolist.db import (
     Task,
     Worklist,
-    create_task,
-    create_worklist,
-    get_users,
-    get_worklists,
-    get_tasks,
-    update_entity,
-    delete_entity
+    TaskRow,
+    WorklistSummary,
+    PAGE_SIZE,
+    to_row,
+    parse_date_filter,
 )
+from todolist.async_db import AsyncRepository
 from .widgets.select import Select
-from typing import List
+from .widgets.task_list import TaskList
+from .widgets.footer import StatusFooter
+from .widgets.stats_panel import StatsPanel
+from typing import Callable, Dict, Hashable, List, Tuple
+
+HIGHLIGHT_DELAY = 0.15 # seconds the cursor has to stay on a worklist before its tasks are loaded
+TASK_CACHE_SIZE = 8 # worklists whose first tasks are kept, so going back to them is instant
+WRITE_DELAY = 0.5 # seconds switch flips are collected for, before they are written in one transaction
+
+class LRUCache:
+    """A dict of at most size items, the least recently used one is dropped first"""
+
+    def __init__(self, size: int):
+        self.size = size
+        self._items = OrderedDict()
+
+    def __contains__(self, key: Hashable) -> bool:
+        return key in self._items
+
+    def get(self, key: Hashable):
+        if key not in self._items:
+            return None
+        self._items.move_to_end(key)
+        return self._items[key]
+
+    def put(self, key: Hashable, value):
+        self._items[key] = value
+        self._items.move_to_end(key)
+        while len(self._items) > self.size:
+            self._items.popitem(last=False)
+
+    def clear(self):
+        self._items.clear()
+
+class PendingWrites:
+    """The completed value of the tasks flipped in the ui but not written yet, by task id.
+
+    A task flipped several times is written once, with its last value. Rows read from the
+    database are passed through overlay() so they don't show the old value in the meantime.
+    """
+
+    def __init__(self):
+        self.pending: Dict[int, bool] = {}
+        self.writing: Dict[int, bool] = {} # taken by the write in flight
+
+    def __len__(self) -> int:
+        return len(self.pending.keys() | self.writing.keys())
+
+    def set(self, task_id: int, completed: bool):
+        self.pending[task_id] = completed
+
+    def discard(self, task_id: int):
+        self.pending.pop(task_id, None)
 
-class TaskItem(Static):
-    """A Task Item Widget. Holds a task text, date, completed, and remove button"""
+    def take(self) -> Dict[int, bool]:
+        """The writes to make now, they count as pending until done() is called"""
+        self.writing, self.pending = self.pending, {}
+        return self.writing
 
-    def __init__(self, task: Task) -> None:
-        super().__init__()
-        self.my_task: Task = task
+    def done(self):
+        self.writing = {}
+
+    def overlay(self, rows: List[TaskRow]) -> List[TaskRow]:
+        values = {**self.writing, **self.pending}
+        if not values:
+            return rows
+        return [row._replace(completed=values[row.id]) if row.id in values else row for row in rows]
+
+def write_completed(repo, values: Dict[int, bool]):
+    """Saves completed for many tasks in one transaction, one UPDATE for each value"""
+    with repo.command():
+        for value in (True, False):
+            ids = [task_id for task_id, completed in values.items() if completed == value]
+            if ids:
+                repo.set_completed(ids, value)
+
+async def reconcile(container: Widget, widgets: Dict[int, Widget], rows: list, create: Callable, update: Callable):
+    """Makes the widgets of container show rows, keyed by row id, touching only what changed.
+
+    widgets maps a row id to the widget showing it and is kept up to date. create(row) makes the
+    widget for a new row and update(widget, row) is called with the current row of a kept widget.
+    """
+    ids = [row.id for row in rows]
+    wanted = set(ids)
+    removed = [widgets.pop(id) for id in list(widgets) if id not in wanted]
+    kept = [widgets[id] for id in ids if id in widgets]
+    kept_set = set(kept)
+    if kept != [child for child in container.children if child in kept_set]:
+        # the order changed (doesn't happen when adding or removing), start over
+        removed.extend(kept)
+        widgets.clear()
+    if removed:
+        await asyncio.gather(*(widget.remove() for widget in removed))
+
+    # mount the new rows in runs, each one right before the next kept widget
+    new_widgets = []
+    last = None
+    for row in rows:
+        widget = widgets.get(row.id)
+        if widget is None:
+            widget = widgets[row.id] = create(row)
+            new_widgets.append(widget)
+            continue
+        update(widget, row)
+        if new_widgets:
+            await container.mount(*new_widgets, before=widget)
+            new_widgets = []
+        last = widget
+    if new_widgets and last is not None:
+        await container.mount(*new_widgets, after=last)
+    elif new_widgets:
+        await container.mount(*new_widgets)
+
+def worklist_label(worklist: WorklistSummary) -> str:
+    return f"{worklist.name}\n{worklist.open} open / {worklist.completed} done"
+
+class WorklistItem(ListItem):
+    """One worklist in the sidebar: its name, counts and a delete button"""
+
+    def __init__(self, worklist: WorklistSummary) -> None:
+        super().__init__(classes="worklist-item-container", name=worklist.id)
+        self.worklist = worklist
 
     def compose(self) -> ComposeResult:
-        """Create child widgets of a stopwatch."""
-        yield Label(self.my_task.task, classes="task-words")
-        yield Label(self.my_task.date_created, classes="task-date")
-        yield Switch(classes="task-checkbox", value=self.my_task.completed, name=self.my_task.id)
-        yield Button.error("Remove", name=self.my_task.id)
-
-    def on_switch_changed(self, message):
-        self.my_task.completed = message.value
-        self.my_task = update_entity(self.my_task)
-
-    def on_button_pressed(self, message:Button.Pressed):
-        old_tasks:List = self.parent.tasks # get the tasks from the parent
-        old_tasks.remove(self.my_task) # remove the old task
-        self.parent.tasks = old_tasks # this causes an update on the parent
-        delete_entity(self.my_task) # delete from database
-
-class TaskItems(Vertical):
-    tasks: List[Task] = reactive([], always_update=True)
-    async def watch_tasks(self):
-        try:
-            await self.query("TaskItem").remove()
-        except:
-            pass
-        for task in self.tasks:
-            self.mount(TaskItem(task))
+        with Horizontal():
+            yield Label(worklist_label(self.worklist), name=self.worklist.id, classes="worklist-item")
+            yield Button.error("X", classes="worklist-item-button", name=self.worklist.id)
+
+    def update_worklist(self, worklist: WorklistSummary):
+        """Shows the new name/counts of the worklist without remounting"""
+        if worklist == self.worklist:
+            return
+        self.worklist = worklist
+        self.query_one(".worklist-item", Label).update(worklist_label(worklist))
 
 class Worklists(ListView):
     """This holds the names of the worklists on the left sidebar"""
     worklists = reactive([], always_update=True)
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.items: Dict[int, WorklistItem] = {} # worklist id -> the widget showing it
+
     async def watch_worklists(self):
         return await self.reload_list(self.worklists)
-    
-    async def reload_list(self, worklists: List[Worklist]):
-        cache_index = self.index
-        await self.query(".worklist-item-container").remove()
-        for worklist in worklists:
-            self.mount(
-                ListItem(
-                    Horizontal(
-                    Label(worklist.name, name=worklist.id, classes="worklist-item"),
-                    Button.error("X", classes="worklist-item-button", name=worklist)), 
-                classes="worklist-item-container", name=worklist.id)
-            )
+
+    async def reload_list(self, worklists: List[WorklistSummary]):
+        highlighted = self.highlighted_child
+        await reconcile(self, self.items, worklists, WorklistItem, WorklistItem.update_worklist)
         self.refresh(layout=True)
-        self.index = cache_index if cache_index is not None else 0
-    
-    def on_button_pressed(self, message:Button.Pressed):
+        if highlighted is not None and highlighted in self._nodes:
+            # keep the same worklist highlighted. Setting the index posts Highlighted, so only when it moved
+            index = self._nodes.index(highlighted)
+            if index != self.index:
+                self.index = index
+        else:
+            self.index = self.index if self.index is not None else 0
+
+    async def on_button_pressed(self, message:Button.Pressed):
         """Called when the delete button is pressed on a worklist"""
-        worklist = message.button.name
-        self.worklists.remove(worklist) # remove the old task
-        self.worklists = self.worklists # this causes an update on the parent
+        worklist_id = message.button.name
+        self.worklists = [w for w in self.worklists if w.id != worklist_id] # this causes an update on the parent
         if len(self.worklists) == 0:
-            tasklist_widget: TaskItems = self.parent.parent.parent.parent.parent.query_one("#task-items")
-            tasklist_widget.tasks =  [] # change to zero
-        delete_entity(worklist) # delete from database
+            tasklist_widget: TaskList = self.parent.parent.parent.parent.parent.query_one("#task-items")
+            await tasklist_widget.show_rows([]) # change to zero
+        self.app.remove_entity(Worklist, worklist_id) # delete from database in the background
         self.refresh(layout=True)
 
 
@@ -96,13 +198,25 @@ class TodoListApp(App):
     """A Textual app to manage a todo list."""
 
     CSS_PATH = "style.css"
-    BINDINGS = [("d", "toggle_dark", "Toggle dark mode")]
+    BINDINGS = [
+        ("d", "toggle_dark", "Toggle dark mode"),
+        ("n", "next_page", "Scroll tasks down"),
+        ("p", "prev_page", "Scroll tasks up"),
+        ("s", "toggle_stats", "Query stats"),
+    ]
 
     worklist_id = None
 
     def __init__(self, *args, **kwargs):
         super().__init__(*args, **kwargs)
-        self.users = get_users()
+        # worklist id -> (number of tasks, first PAGE_SIZE tasks) of the current and nearby worklists
+        self.task_cache: LRUCache = LRUCache(TASK_CACHE_SIZE)
+        self._settle_timer = None
+        self.writes = PendingWrites()
+        self._write_timer = None
+        # all database work happens on its own thread, so the ui never waits on sqlite
+        self.db = AsyncRepository()
+        self.users = self.db.run_sync(self.db.repo.get_users)
         self.user_name_list = [
             dict(value=i, text=f"{user.first_name} {user.last_name}")
             for i, user in enumerate(self.users)
@@ -117,11 +231,13 @@ class TodoListApp(App):
         with Container(id="app-grid"):
             # Left Sidebar
             with Container(id='sidebar-vertical'):
-                # user dropdown selection
+                # user dropdown selection, typing filters it. Only the first matches get list items,
+                # so a database with thousands of users doesn't mount thousands of widgets
                 yield Select(
                     items=self.user_name_list,
                     placeholder="Select user ...",
                     list_mount="#sidebar-vertical",
+                    search=True,
                     id="user-list-widget",
                 )
                 # Worklists
@@ -131,60 +247,232 @@ class TodoListApp(App):
                 yield Input(placeholder="New Worklist", id="worklist-input")
             # Right Section
             with Vertical(id='right-section'):
+                # search the tasks of all the user's worklists
+                yield Input(placeholder="Search tasks ...", id="search-input")
+                # the user's tasks by the day they were made
+                yield Input(placeholder="Filter by date: since 7d, until 2024-01-31, stale 30 ...", id="date-filter-input")
                 # All the task items
                 with Vertical(id="task-item-container"):
-                    yield TaskItems(id="task-items")
+                    # only the tasks on screen are mounted, the rest are fetched while scrolling
+                    yield TaskList(id="task-items")
                 # input to add a new task item
                 yield Input(placeholder="New Task", id="task-input")
-        yield Footer()
+        yield StatsPanel(id="stats-panel")
+        yield StatusFooter()
 
     def on_input_submitted(self, message):
         """This function is called anytime a user enters text in an input widget
         """
         if message.input.id == "task-input":
-            task = create_task(message.value, worklist_id=self.worklist_id)
-            message.input.value = ""
-            # Weird way of forcing a change
-            tasks = self.query_one("#task-items").tasks
-            tasks.append(task)
-            self.query_one("#task-items").tasks = tasks
+            if self.worklist_id is not None:
+                self.add_task(message.value, self.worklist_id)
+                message.input.value = ""
+        if message.input.id == "search-input":
+            self.search_tasks(message.value)
+        if message.input.id == "date-filter-input":
+            self.filter_tasks(message.value)
         if message.input.id == "worklist-input":
             if self.user is not None:
-                create_worklist(message.value, user_id=self.user.id)
-                self.update_worklist_widget()
+                self.add_worklist(message.value, self.user.id)
                 message.input.value = ""
 
+    # Database work runs in textual workers that await the db thread. Writes are never cancelled
+    # and run in the order they were made. Loads are exclusive: a new load cancels the one in flight
+
+    @work(group="db-write", exclusive=False)
+    async def add_task(self, text: str, worklist_id: int):
+        task = await self.db.transaction(lambda repo: to_row(repo.create_task(text, worklist_id=worklist_id)))
+        self.forget_tasks()
+        if worklist_id == self.worklist_id:
+            self.query_one("#task-items").append(task)
+        await self.update_worklist_counts()
+
+    @work(group="db-write", exclusive=False)
+    async def add_worklist(self, name: str, user_id: int):
+        await self.db.create_worklist(name, user_id=user_id)
+        await self.update_worklist_widget()
+
+    def set_completed(self, task_id: int, completed: bool):
+        """Switch flips are written behind: collected for WRITE_DELAY, then written in one transaction"""
+        self.writes.set(task_id, completed)
+        self.show_pending_writes()
+        if self._write_timer is None:
+            self._write_timer = self.set_timer(WRITE_DELAY, self.on_write_delay)
+
+    def on_write_delay(self):
+        self._write_timer = None
+        if self.writes.writing:
+            # the last write is still going, these wait for the next round
+            self._write_timer = self.set_timer(WRITE_DELAY, self.on_write_delay)
+        else:
+            self.flush_writes()
+
+    @work(group="db-write", exclusive=False)
+    async def flush_writes(self):
+        values = self.writes.take()
+        await self.db.run(write_completed, self.db.repo, values)
+        # only once written: if the app exits before that, write_pending() writes them again
+        self.writes.done()
+        if not self.is_running:
+            return # the app is closing, its widgets are gone
+        self.show_pending_writes()
+        self.forget_tasks()
+        await self.update_worklist_counts()
+
+    def show_pending_writes(self):
+        self.query_one(StatusFooter).pending = len(self.writes)
+
+    def write_pending(self):
+        """Saves the switch flips not written yet, waiting for it. Called when the app has exited"""
+        values = {**self.writes.writing, **self.writes.pending}
+        if values:
+            self.db.run_sync(write_completed, self.db.repo, values)
+
+    @work(group="db-write", exclusive=False)
+    async def remove_entity(self, model, id: int):
+        if model == Task:
+            self.writes.discard(id)
+            self.show_pending_writes()
+        await self.db.delete_by_id(model, [id])
+        self.forget_tasks()
+        await self.update_worklist_counts()
+
+    @work(group="tasks", exclusive=True)
+    async def search_tasks(self, query: str):
+        """Shows the tasks matching query in the task pane. An empty query goes back to the worklist"""
+        tasklist_widget: TaskList = self.query_one("#task-items")
+        if query.strip() and self.user is not None:
+            results = await self.db.search_tasks(self.user.id, query, limit=PAGE_SIZE)
+            await tasklist_widget.show_rows(self.writes.overlay(results))
+        elif self.worklist_id is not None:
+            await self.show_worklist_tasks(self.worklist_id)
+
+    @work(group="tasks", exclusive=True)
+    async def filter_tasks(self, text: str):
+        """Shows the tasks matching a date filter in the task pane. An empty filter goes back to the worklist"""
+        tasklist_widget: TaskList = self.query_one("#task-items")
+        filter_input = self.query_one("#date-filter-input", Input)
+        try:
+            date_filter = parse_date_filter(text) if text.strip() else None
+        except ValueError:
+            filter_input.add_class("invalid")
+            return
+        filter_input.remove_class("invalid")
+        if date_filter is not None and self.user is not None:
+            if date_filter.stale_days is not None:
+                results = await self.db.get_stale_tasks(date_filter.stale_days, user_id=self.user.id, limit=PAGE_SIZE)
+            else:
+                results = await self.db.get_tasks_between(self.user.id, date_filter.since, date_filter.until, limit=PAGE_SIZE)
+            await tasklist_widget.show_rows(self.writes.overlay(results))
+        elif self.worklist_id is not None:
+            await self.show_worklist_tasks(self.worklist_id)
+
     def action_toggle_dark(self) -> None:
         """An action to toggle dark mode."""
         self.dark = not self.dark
 
-    def update_worklist_widget(self):
+    async def update_worklist_widget(self):
         """This will ensure the work list is updated and refreshed"""
         # Update the GUI and the worklist widget
-        worklists = get_worklists(self.user.id) # get worklist from database
+        worklists = await self.db.get_worklist_summaries(self.user.id) # get worklist from database
         worklists_widget: ListView = self.query_one("#worklists") 
         worklists_widget.worklists = worklists
         worklists_widget.refresh(layout=True)
 
+    async def update_worklist_counts(self):
+        """Refreshes the open/done counts in the sidebar after a task changed"""
+        if self.user is not None:
+            worklists = await self.db.get_worklist_summaries(self.user.id)
+            worklists_widget: Worklists = self.query_one("#worklists")
+            worklists_widget.worklists = worklists # only the changed labels are updated
+
     def on_select_changed(self, event: Select.Changed) -> None:
         """This function is called when the a user is selected from the dropdown
         It will load all the users workslists and load the all the tasks from the first worklist
         """
         self.user = self.users[int(event.value)] # get the user_id selected
-        self.update_worklist_widget()
+        self.load_worklists()
+
+    @work(group="worklists", exclusive=True)
+    async def load_worklists(self):
+        await self.update_worklist_widget()
 
     def on_list_view_highlighted(self, event):
         "This function is called anytime a user clicks on a worklist"
         worklists_widget: ListView = self.query_one("#worklists")
         if worklists_widget.highlighted_child is not None:
-            self.worklist_id = int(worklists_widget.highlighted_child.name)
-            tasklist_widget: TaskItems = self.query_one("#task-items")
-            tasklist_widget.tasks =  get_tasks(self.worklist_id)
+            worklist_id = int(worklists_widget.highlighted_child.name)
+            if worklist_id == self.worklist_id:
+                return # same worklist, just moved in the list
+            self.worklist_id = worklist_id
+            # holding an arrow key moves over many worklists, only load the one the cursor stops on.
+            # The cached ones are shown right away, that costs no query
+            if worklist_id in self.task_cache:
+                self.load_tasks()
+            if self._settle_timer is not None:
+                self._settle_timer.stop()
+            self._settle_timer = self.set_timer(HIGHLIGHT_DELAY, self.on_worklist_settled)
+
+    def on_worklist_settled(self):
+        """The cursor stayed on a worklist: load its tasks and the ones of the worklists next to it"""
+        if self.worklist_id not in self.task_cache:
+            self.load_tasks()
+        worklists: List[WorklistSummary] = self.query_one("#worklists").worklists
+        ids = [w.id for w in worklists]
+        if self.worklist_id in ids:
+            index = ids.index(self.worklist_id)
+            self.prefetch_tasks(ids[max(index - 1, 0):index] + ids[index + 1:index + 2])
+
+    @work(group="tasks", exclusive=True)
+    async def load_tasks(self):
+        """Shows the tasks of the current worklist"""
+        await self.show_worklist_tasks(self.worklist_id)
+
+    @work(group="prefetch", exclusive=True)
+    async def prefetch_tasks(self, worklist_ids: List[int]):
+        for worklist_id in worklist_ids:
+            if worklist_id not in self.task_cache:
+                self.task_cache.put(worklist_id, await self.get_task_list_head(worklist_id))
+
+    async def get_task_list_head(self, worklist_id: int) -> Tuple[int, List[TaskRow]]:
+        """The number of tasks of a worklist and its first PAGE_SIZE tasks"""
+        repo = self.db.repo
+        return await self.db.run(lambda: (repo.count_tasks(worklist_id), repo.get_task_rows(worklist_id, limit=PAGE_SIZE)))
+
+    def forget_tasks(self):
+        """Empties the task cache after a write, it could be out of date"""
+        self.workers.cancel_group(self, "prefetch")
+        self.task_cache.clear()
+
+    async def show_worklist_tasks(self, worklist_id: int):
+        async def fetch(offset: int, limit: int):
+            return self.writes.overlay(await self.db.get_task_rows(worklist_id, offset=offset, limit=limit))
+        head = self.task_cache.get(worklist_id)
+        if head is None:
+            head = await self.get_task_list_head(worklist_id)
+            self.task_cache.put(worklist_id, head)
+        total, first_block = head
+        tasklist_widget: TaskList = self.query_one("#task-items")
+        await tasklist_widget.show(fetch, total, self.writes.overlay(first_block))
+
+    def action_next_page(self) -> None:
+        """Scrolls the tasks down one screen"""
+        self.query_one("#task-items").scroll_page_down()
+
+    def action_prev_page(self) -> None:
+        """Scrolls the tasks up one screen"""
+        self.query_one("#task-items").scroll_page_up()
+
+    def action_toggle_stats(self) -> None:
+        """Shows or hides the query stats (TODOLIST_STATS=1 turns them on)"""
+        self.query_one("#stats-panel", StatsPanel).toggle()
 
 
 def main():
     app = TodoListApp()
     app.run()
+    app.write_pending()
+    app.db.close()
 
 
 if __name__ == "__main__":
@@ -0,0 +1,30 @@
+"""The footer with the key bindings, and on its right how many changes are still to be saved"""
+from rich.text import Text
+from textual.reactive import reactive
+from textual.widgets import Footer
+
+
+class StatusFooter(Footer):
+    """A Footer that also shows the number of pending writes when there are some"""
+
+    DEFAULT_CSS = """
+    StatusFooter > .status-footer--pending {
+        background: $warning;
+        color: $text;
+    }
+    """
+    COMPONENT_CLASSES = Footer.COMPONENT_CLASSES | {"status-footer--pending"}
+
+    pending = reactive(0)
+
+    def render(self):
+        text = super().render()
+        if not self.pending:
+            return text
+        status = Text(f" {self.pending} pending write{'s' if self.pending != 1 else ''} ",
+                      style=self.get_component_rich_style("status-footer--pending"))
+        # the bindings are cut short if the status doesn't fit next to them
+        text = text.copy()
+        text.truncate(max(self.size.width - status.cell_len - 1, 0))
+        text.append(" " * max(self.size.width - text.cell_len - status.cell_len, 1))
+        return text + status
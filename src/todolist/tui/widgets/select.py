@@ -1,6 +1,8 @@
 # LICENSE: https://github.com/mitosch/textual-select/blob/main/LICENSE
 from __future__ import annotations
 
+from collections import defaultdict
+
 from textual.widget import Widget, events
 from textual.containers import Vertical
 from textual.widgets import Label, ListView, ListItem, Input
@@ -11,6 +13,48 @@ from rich.highlighter import Highlighter
 
 # from textual import log
 
+SEARCH_DELAY = 0.1  # seconds without a keystroke before the list is filtered
+MAX_SHOWN = 50  # matching items shown at most when searching
+NGRAM_SIZE = 3
+NGRAM_MIN_ITEMS = 1000  # shorter lists are just scanned
+
+
+class SearchIndex:
+    """Finds the items whose text contains a query, ignoring case.
+
+    The texts are lowercased once. Big lists also get an index of the 3-grams of every text, so
+    only the items having all the 3-grams of the query are checked. When the query extends the
+    previous one, only the previous matches are checked.
+    """
+
+    def __init__(self, texts: list[str]) -> None:
+        self.texts = [text.casefold() for text in texts]
+        self.ngrams: dict[str, list[int]] | None = None
+        if len(self.texts) >= NGRAM_MIN_ITEMS:
+            self.ngrams = defaultdict(list)
+            for i, text in enumerate(self.texts):
+                for ngram in {text[j:j + NGRAM_SIZE] for j in range(len(text) - NGRAM_SIZE + 1)}:
+                    self.ngrams[ngram].append(i)
+        self._last_query = ""
+        self._last_matches: list[int] = list(range(len(self.texts)))
+
+    def search(self, query: str) -> list[int]:
+        """The positions of the matching texts, in order"""
+        query = query.casefold()
+        if self._last_query and self._last_query in query:
+            candidates = self._last_matches
+        elif self.ngrams is not None and len(query) >= NGRAM_SIZE:
+            postings = sorted(
+                (self.ngrams.get(query[j:j + NGRAM_SIZE], []) for j in range(len(query) - NGRAM_SIZE + 1)),
+                key=len,
+            )
+            candidates = sorted(set(postings[0]).intersection(*postings[1:]))
+        else:
+            candidates = range(len(self.texts))
+        matches = [i for i in candidates if query in self.texts[i]]
+        self._last_query, self._last_matches = query, matches
+        return matches
+
 
 class SelectListSearchInput(Input):
     """Input for searching through the list."""
@@ -40,14 +84,13 @@ class SelectListSearchInput(Input):
             value=value, placeholder=placeholder, name=name, id=id, classes=classes
         )
         self.select_list = select_list
+        self._filter_timer = None
 
     def watch_value(self, value):
-        self.select_list.list_view.clear()
-        self.select_list.items_filtered = []
-        for item in self.select_list.items:
-            if value.lower() in item["text"].lower():
-                self.select_list.list_view.append(ListItem(Label(item["text"])))
-                self.select_list.items_filtered.append(item)
+        # filter once the typing pauses, not on every keystroke
+        if self._filter_timer is not None:
+            self._filter_timer.stop()
+        self._filter_timer = self.set_timer(SEARCH_DELAY, lambda: self.select_list.filter(value))
 
     def action_scroll_down(self) -> None:
         self.select_list.list_view.action_cursor_down()
@@ -77,6 +120,13 @@ class SelectListView(ListView):
         )
         self.select_list = select_list
 
+    def validate_index(self, index: int | None) -> int | None:
+        # only the first len(items_filtered) items are shown, the others are hidden
+        shown = len(self.select_list.items_filtered)
+        if not shown or index is None:
+            return None
+        return min(max(index, 0), shown - 1)
+
     def on_blur(self) -> None:
         self.select_list.display = False
 
@@ -128,15 +178,16 @@ class SelectList(Widget):
         super().__init__(name=name, id=id, classes=classes)
         self.select = select
         self.items = items
-        self.items_filtered = items
         self.search = search
+        # with search, a fixed set of list items shows the first matches
+        self.items_filtered = items[:MAX_SHOWN] if search else items
+        self.search_index = SearchIndex([item["text"] for item in items]) if search else None
 
     def compose(self):
         widgets = []
-        list_items = []
-        for item in self.items:
-            list_items.append(ListItem(Label(item["text"])))
-        self.list_view = SelectListView(*list_items, select_list=self)
+        self.labels = [Label(item["text"]) for item in self.items_filtered]
+        self.list_items = [ListItem(label) for label in self.labels]
+        self.list_view = SelectListView(*self.list_items, select_list=self)
 
         if self.search:
             widgets.append(SelectListSearchInput(select_list=self))
@@ -161,6 +212,16 @@ class SelectList(Widget):
             # looks like Gtk is handling it the same.
             event.prevent_default()
 
+    def filter(self, query: str) -> None:
+        """Shows the items containing query. The list items are reused, the ones not needed are hidden"""
+        matches = self.search_index.search(query)
+        self.items_filtered = [self.items[i] for i in matches[:MAX_SHOWN]]
+        for i, (list_item, label) in enumerate(zip(self.list_items, self.labels)):
+            list_item.display = i < len(self.items_filtered)
+            if list_item.display:
+                label.update(self.items_filtered[i]["text"])
+        self.list_view.index = 0
+
     def select_highlighted_item(self) -> None:
         print("Select Highlighted Item: ", self.list_view.index)
         if self.list_view.index is not None:
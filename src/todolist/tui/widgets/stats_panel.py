@@ -0,0 +1,36 @@
+"""The query stats (see todolist.query_stats), shown over the right of the screen with the s key"""
+from textual.widgets import Static
+
+from todolist.query_stats import stats_table
+
+REFRESH = 1.0 # seconds between updates while the panel is shown
+
+
+class StatsPanel(Static):
+    """Hidden until toggled. Only redraws the table while it is shown"""
+
+    DEFAULT_CSS = """
+    StatsPanel {
+        dock: right;
+        width: 100;
+        height: 100%;
+        display: none;
+        background: $panel;
+        border-left: tall $accent;
+        overflow-y: auto;
+    }
+    """
+
+    def on_mount(self):
+        self._timer = self.set_interval(REFRESH, self.refresh_stats, pause=True)
+
+    def toggle(self):
+        self.display = not self.display
+        if self.display:
+            self.refresh_stats()
+            self._timer.resume()
+        else:
+            self._timer.pause()
+
+    def refresh_stats(self):
+        self.update(stats_table())
@@ -0,0 +1,200 @@
+"""A virtual task list: only the tasks on screen have widgets.
+
+The list knows how many tasks there are and pulls them from a fetch(offset, limit) coroutine in
+blocks, as they scroll into view. A spacer above and below the row widgets takes the place of the
+tasks that are off screen, so the scrollbar behaves as if every task was mounted. When scrolling,
+the same few row widgets are given other tasks instead of mounting new ones.
+"""
+from typing import Awaitable, Callable, Dict, List, Optional, Set
+
+from textual.containers import VerticalScroll
+from textual.widget import Widget
+from textual.widgets import Button, Label, Static, Switch
+
+from todolist.db import Task, TaskRow, PAGE_SIZE
+
+ROW_HEIGHT = 6  # a TaskItem is 5 high with a margin of 1 below (see style.css)
+OVERSCAN = 2  # rows mounted above and below the screen, so scrolling a bit shows no blank rows
+MAX_CACHED_BLOCKS = 20  # fetched blocks kept around, the ones far from the screen are dropped
+
+Fetch = Callable[[int, int], Awaitable[List[TaskRow]]]
+
+
+class TaskItem(Static):
+    """A Task Item Widget. Holds a task text, date, completed, and remove button.
+
+    The task list reuses it for another task when scrolling, see show_task.
+    """
+
+    def __init__(self) -> None:
+        super().__init__()
+        self.my_task: Optional[TaskRow] = None
+        self.position: Optional[int] = None  # offset of my_task in the task list
+        # made here so show_task works before the item is mounted
+        self.words = Label(classes="task-words")
+        self.date = Label(classes="task-date")
+        # no slide animation, items get a new task (and switch value) on every scroll
+        self.switch = Switch(classes="task-checkbox", animate=False)
+
+    def compose(self):
+        yield self.words
+        yield self.date
+        yield self.switch
+        yield Button.error("Remove")
+
+    def show_task(self, offset: int, task: Optional[TaskRow]):
+        """Shows the task at offset in the list. None while it is still being fetched"""
+        self.position = offset
+        if task == self.my_task:
+            return
+        self.my_task = task
+        self.words.update(task.task if task is not None else "...")
+        self.date.update(str(task.date_created) if task is not None else "")
+        if task is not None:
+            self.switch.value = task.completed
+
+    def on_switch_changed(self, message: Switch.Changed):
+        message.stop()
+        # skip the changes made by show_task, and the ones for a task this item no longer shows
+        if self.my_task is None or message.value == self.my_task.completed or message.value != self.switch.value:
+            return
+        self.my_task = self.my_task._replace(completed=message.value)
+        self.parent.replace(self.position, self.my_task)
+        self.app.set_completed(self.my_task.id, message.value) # save in the background
+
+    def on_button_pressed(self, message: Button.Pressed):
+        message.stop()
+        if self.my_task is None:
+            return
+        task = self.my_task
+        self.parent.remove_at(self.position)
+        self.app.remove_entity(Task, task.id) # delete from database in the background
+
+
+class TaskList(VerticalScroll):
+    """Shows total tasks, fetched in blocks of block_size as they are scrolled to"""
+
+    DEFAULT_CSS = """
+    TaskList > .task-list-spacer {
+        height: 0;
+    }
+    """
+
+    def __init__(self, *args, block_size: int = PAGE_SIZE, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.block_size = block_size
+        self.total = 0
+        self._fetch: Optional[Fetch] = None
+        self._rows: Dict[int, TaskRow] = {}  # offset -> task, the fetched part of the list
+        self._pending: Set[int] = set()  # blocks being fetched
+        self._generation = 0  # bumped when the rows change under a pending fetch, which is then dropped
+        self._window = None  # (start, end) of the rows bound to the items
+        self._items: List[TaskItem] = []
+        self._top = Widget(classes="task-list-spacer")
+        self._bottom = Widget(classes="task-list-spacer")
+
+    def compose(self):
+        yield self._top
+        yield self._bottom
+
+    @property
+    def tasks(self) -> List[TaskRow]:
+        """The tasks that have widgets right now (the ones on screen and the overscan)"""
+        return [item.my_task for item in self._items if item.display and item.my_task is not None]
+
+    async def show(self, fetch: Fetch, total: int, first_block: Optional[List[TaskRow]] = None):
+        """Shows a new list of total tasks, getting them with fetch(offset, limit).
+        first_block are the first block_size tasks if the caller already has them"""
+        self._fetch = fetch
+        self.total = total
+        self._reset()
+        self.scroll_to(y=0, animate=False)
+        if first_block is not None:
+            self._rows.update(enumerate(first_block))
+        elif total:
+            # fetch the first block right away, so it is on screen when this returns
+            await self._load_block(self._generation, 0)
+        self._update_window()
+
+    async def show_rows(self, rows: List[TaskRow]):
+        """Shows tasks that are already in memory (e.g. search results)"""
+        async def fetch(offset: int, limit: int) -> List[TaskRow]:
+            return rows[offset:offset + limit]
+        await self.show(fetch, len(rows))
+
+    def append(self, task: TaskRow):
+        """Adds a task that was just created at the end of the list"""
+        self._rows[self.total] = task
+        self.total += 1
+        self._update_window()
+
+    def replace(self, offset: int, task: TaskRow):
+        """The task at offset changed (its widget already shows it)"""
+        if offset in self._rows:
+            self._rows[offset] = task
+
+    def remove_at(self, offset: int):
+        """Removes the task at offset, the ones after it move up"""
+        self._rows = {o - (o > offset): task for o, task in self._rows.items() if o != offset}
+        self.total -= 1
+        self._reset(keep_rows=True)
+        self._update_window()
+
+    def _reset(self, keep_rows: bool = False):
+        if not keep_rows:
+            self._rows = {}
+        self._generation += 1
+        self._pending = set()
+        self._window = None
+
+    def watch_scroll_y(self, old_value: float, new_value: float) -> None:
+        super().watch_scroll_y(old_value, new_value)
+        self._update_window()
+
+    def on_resize(self, event):
+        self._update_window()
+
+    def _update_window(self):
+        """Binds the rows around the scroll position to the items, mounting items only if the screen got bigger"""
+        first = int(self.scroll_y) // ROW_HEIGHT
+        start = max(0, first - OVERSCAN)
+        end = min(self.total, first + self.size.height // ROW_HEIGHT + 1 + OVERSCAN)
+        start = min(start, end)
+        if (start, end) == self._window and all(o in self._rows for o in range(start, end)):
+            return
+        self._window = (start, end)
+
+        if len(self._items) < end - start:
+            new_items = [TaskItem() for _ in range(end - start - len(self._items))]
+            self._items.extend(new_items)
+            self.mount(*new_items, before=self._bottom)
+        self._top.styles.height = start * ROW_HEIGHT
+        self._bottom.styles.height = (self.total - end) * ROW_HEIGHT
+        for offset, item in enumerate(self._items, start):
+            item.display = offset < end
+            if offset < end:
+                item.show_task(offset, self._rows.get(offset))
+
+        missing = {offset // self.block_size for offset in range(start, end) if offset not in self._rows}
+        for block in missing - self._pending:
+            self._pending.add(block)
+            self.run_worker(self._load_block(self._generation, block), group="task-list", exclusive=False)
+
+    async def _load_block(self, generation: int, block: int):
+        rows = await self._fetch(block * self.block_size, self.block_size)
+        if generation != self._generation:
+            return  # the list changed while fetching, these offsets are wrong now
+        self._pending.discard(block)
+        self._rows.update(enumerate(rows, block * self.block_size))
+        self._drop_far_blocks()
+        self._window = None
+        self._update_window()
+
+    def _drop_far_blocks(self):
+        """Keeps memory flat when scrolling through a long list"""
+        if len(self._rows) <= MAX_CACHED_BLOCKS * self.block_size:
+            return
+        first = int(self.scroll_y) // ROW_HEIGHT
+        keep = MAX_CACHED_BLOCKS // 2 * self.block_size
+        low, high = first - keep, first + keep
+        self._rows = {o: task for o, task in self._rows.items() if low <= o < high}
@@ -0,0 +1,12 @@
+import pytest
+
+from todolist import db
+
+
+@pytest.fixture
+def database(tmp_path):
+    """An empty database in tmp_path that the app uses for the test"""
+    db.configure(db_path=tmp_path / "test.db")
+    db.SQLModel.metadata.create_all(db.engine)
+    yield tmp_path / "test.db"
+    db.engine.dispose()
@@ -0,0 +1,63 @@
+import multiprocessing
+import os
+import subprocess
+import sys
+
+from sqlalchemy import func, select
+
+from todolist import db
+from todolist.async_db import AsyncRepository
+from todolist.db import Task
+
+
+def _write_tasks(db_path, bulk:bool, calls:int):
+    db.configure(db_path=db_path)
+    for i in range(calls):
+        if bulk:
+            db.create_tasks_bulk([f"bulk {i} {n}" for n in range(5)], worklist_id=1)
+        else:
+            db.create_task(f"single {i}", worklist_id=1)
+
+def test_concurrent_writers_get_their_own_ids(database):
+    """Two processes creating tasks in bulk and one creating them one by one, like the repl and the tui"""
+    db.create_user("Ada", "Lovelace")
+    db.create_worklist("Work", user_id=1)
+    calls = 200
+    context = multiprocessing.get_context("spawn")
+    writers = [context.Process(target=_write_tasks, args=(database, bulk, calls)) for bulk in (True, True, False)]
+    for writer in writers:
+        writer.start()
+    for writer in writers:
+        writer.join(timeout=120)
+    assert [writer.exitcode for writer in writers] == [0, 0, 0]
+    with db.engine.connect() as connection:
+        assert connection.execute(select(func.count()).select_from(Task.__table__)).scalar_one() == 2 * calls * 5 + calls
+
+def test_repository_create_tasks_returns_the_ids(database):
+    db.create_user("Ada", "Lovelace")
+    db.create_worklist("Work", user_id=1)
+    repo = db.Repository()
+    with repo.command():
+        first = repo.create_task("first", worklist_id=1)
+        rows = repo.create_tasks(["a", "b"], worklist_id=1)
+    assert [row.id for row in rows] == [first.id + 1, first.id + 2]
+    assert [task.task for task in db.get_tasks(1)] == ["first", "a", "b"]
+    repo.close()
+
+def test_pooled_connections_move_between_threads(database):
+    """The connection opened here is used by the tui's db thread next, then by this thread again"""
+    db.create_user("Ada", "Lovelace")
+    adb = AsyncRepository()
+    assert [user.first_name for user in adb.run_sync(adb.repo.get_users)] == ["Ada"]
+    assert [user.first_name for user in db.get_users()] == ["Ada"]
+    assert db.engine.pool.checkedin() == 1 # never two at the same time, so one connection did it all
+    adb.close()
+
+def test_python_m_todolist_db_makes_synthetic_data(tmp_path):
+    """python -m todolist.db runs the module as __main__, todolist.fake_data must not import it again"""
+    result = subprocess.run([sys.executable, "-m", "todolist.db", "--users", "2"], capture_output=True, text=True,
+                            env=dict(os.environ, TODOLIST_DB=str(tmp_path / "synthetic.db")))
+    assert result.returncode == 0, result.stderr
+    db.configure(db_path=tmp_path / "synthetic.db")
+    assert len(db.get_users()) == 2
+    db.engine.dispose()
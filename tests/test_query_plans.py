@@ -0,0 +1,28 @@
+"""The hot queries of todolist.db use an index instead of scanning a table or sorting their rows"""
+import pytest
+from sqlalchemy import select
+
+from todolist.db import Task, Worklist, explain_query_plan, _select_worklist_summaries, _select_stale_tasks
+
+HOT_QUERIES = {
+    # get_worklists(user_id)
+    "get_worklists": select(Worklist).where(Worklist.user_id == 1).order_by(Worklist.id),
+    # get_tasks(worklist_id)
+    "get_tasks": select(Task).where(Task.worklist_id == 1).order_by(Task.id),
+    # the lookup sqlite does for ON DELETE CASCADE from worklist
+    "cascade_worklist_delete": select(Task.id).where(Task.worklist_id == 1),
+    # get_worklist_summaries(user_id), the task counts come from the (worklist_id, completed) index
+    "get_worklist_summaries": _select_worklist_summaries(1).order_by(Worklist.id),
+    # open (or done) tasks of a worklist
+    "get_tasks_by_completed": select(Task).where(Task.worklist_id == 1, Task.completed == False),
+    # get_stale_tasks(days), oldest first straight from the partial index of the open tasks.
+    # get_tasks_between and get_stale_tasks of one user range scan each worklist and sort what they found
+    "get_stale_tasks": _select_stale_tasks(30, None, 100),
+}
+
+
+@pytest.mark.parametrize("name", HOT_QUERIES)
+def test_query_uses_an_index(database, name):
+    plan = explain_query_plan(HOT_QUERIES[name])
+    assert all("USING" in step and "INDEX" in step for step in plan if step.startswith(("SCAN", "SEARCH"))), plan
+    assert not any("TEMP B-TREE" in step for step in plan), plan
@@ -0,0 +1,33 @@
+"""todo-repl --script: the lines it writes to stdout, and its exit codes"""
+from datetime import date
+
+from todolist import db
+from todolist.repl.app import AppState, run_script
+
+
+def run(lines):
+    state = AppState()
+    try:
+        return run_script(state, lines)
+    finally:
+        state.repo.close()
+
+def test_search_and_filter_write_their_rows(database, capsys):
+    db.create_user("Ada", "Lovelace")
+    db.create_worklist("Errands", user_id=1)
+    db.create_tasks_bulk([dict(task="buy milk", date_created=date(2024, 1, 2)),
+                          dict(task="milk\tand more", date_created=date(2024, 1, 3), completed=True)], worklist_id=1)
+    assert run(["select 1", "search milk", "filter since 2024-01-03"]) == 0
+    lines = [line.split("\t") for line in capsys.readouterr().out.splitlines()]
+    # a row is written before the line of its command, with an empty first field
+    assert [line[1:] for line in lines if line[0] == ""] == [
+        ["1", "1", "buy milk", "2024-01-02", "False"],
+        ["2", "1", "milk\\tand more", "2024-01-03", "True"],
+        ["2", "1", "milk\\tand more", "2024-01-03", "True"]]
+    assert [line[-1] for line in lines if line[0]] == ["select 1", "search milk", "filter since 2024-01-03"]
+    assert lines[3][-1] == "search milk" and lines[5][-1] == "filter since 2024-01-03"
+
+def test_an_id_that_is_not_a_number_is_a_bad_command(database, capsys):
+    db.create_user("Ada", "Lovelace")
+    assert run(["select x"]) == 1
+    assert "Bad ids" in capsys.readouterr().err
@@ -0,0 +1,105 @@
+"""The repl applies the changes of a command to the rows it has in memory. After every command
+they must be what reading the page again from the db gives"""
+from datetime import date
+
+import pytest
+
+from todolist import db
+from todolist.db import User, Worklist, Task
+from todolist.repl.app import AppState, run_response
+
+PAGE_SIZE = 5
+TASKS = 12 # worklist 1 holds more than two pages
+WORKLISTS = 7 # user 1 has more than one page
+
+
+@pytest.fixture
+def state(database):
+    db.create_user("Ada", "Lovelace")
+    db.create_user("Alan", "Turing")
+    db.create_worklists_bulk([f"list {number}" for number in range(1, WORKLISTS + 1)], user_id=1)
+    db.create_worklist("not Ada's", user_id=2)
+    db.create_tasks_bulk([dict(task=f"task {number}", date_created=date(2024, 1, number), completed=number % 3 == 0)
+                          for number in range(1, TASKS + 1)], worklist_id=1)
+    db.create_tasks_bulk(["one", "two"], worklist_id=2)
+    state = AppState()
+    state.page_size = PAGE_SIZE
+    run_response(state, User, "select 1")
+    run_response(state, Worklist, "select 1")
+    yield state
+    state.repo.close()
+
+def command(state, model, response):
+    run_response(state, model, response)
+    check(state)
+
+def check(state):
+    """What the repl shows next, the stale lists read again as execute_command does, against the db"""
+    state.refresh_stale(Worklist)
+    state.refresh_stale(Task)
+    assert state.all_worklist_list == db.get_worklist_summaries(
+        state.active_user.id, after_id=state.worklist_page_after, limit=PAGE_SIZE)
+    assert state.worklists_by_id == {worklist.id: worklist for worklist in state.all_worklist_list}
+    assert state.worklist_total == db.count_worklists(state.active_user.id)
+    if state.active_worklist is None:
+        assert state.all_tasklist_list == [] and state.tasks_by_id == {}
+        return
+    assert state.all_tasklist_list == db.get_task_rows(
+        state.active_worklist.id, after_id=state.task_page_after, limit=PAGE_SIZE)
+    assert state.tasks_by_id == {task.id: task for task in state.all_tasklist_list}
+    assert state.task_total == db.count_tasks(state.active_worklist.id)
+
+def test_the_pages_start_as_in_the_db(state):
+    check(state)
+    assert [task.id for task in state.all_tasklist_list] == [1, 2, 3, 4, 5]
+    command(state, Task, "tail")
+    assert [task.id for task in state.all_tasklist_list] == [8, 9, 10, 11, 12]
+
+@pytest.mark.parametrize("page", ["head", "tail"])
+def test_add(state, page):
+    command(state, Task, page)
+    command(state, Task, "add buy milk")
+    command(state, Task, "add first line\nsecond line\nthird line")
+    assert state.task_total == TASKS + 4
+    assert state.all_worklist_list[0].total == TASKS + 4
+
+def test_add_on_a_short_last_page(state):
+    run_response(state, Task, "remove 1-9")
+    check(state)
+    assert [task.id for task in state.all_tasklist_list] == [10, 11, 12]
+    command(state, Task, "add buy milk")
+    assert [task.task for task in state.all_tasklist_list][-1] == "buy milk"
+
+def test_remove_from_a_full_page_moves_the_next_page_up(state):
+    run_response(state, Task, "remove 2")
+    assert state.tasks_stale
+    check(state)
+    assert [task.id for task in state.all_tasklist_list] == [1, 3, 4, 5, 6]
+
+@pytest.mark.parametrize("page", ["head", "tail"])
+@pytest.mark.parametrize("ids", ["1", "12", "4-9", "1-12", "3,5,11"])
+def test_remove(state, page, ids):
+    command(state, Task, page)
+    command(state, Task, f"remove {ids}")
+    # the counts of the worklist, the date of its newest task included
+    command(state, Worklist, "reset worklist")
+
+@pytest.mark.parametrize("page", ["head", "tail"])
+@pytest.mark.parametrize("ids", ["2", "3", "1-5", "4-9", "1-12"])
+def test_complete(state, page, ids):
+    command(state, Task, page)
+    command(state, Task, f"complete {ids}")
+    command(state, Task, f"complete {ids}")
+    command(state, Task, "complete 1")
+
+@pytest.mark.parametrize("page", ["head", "tail"])
+@pytest.mark.parametrize("ids", ["2", "1", "1-3", "6-7", "7"])
+def test_remove_worklists(state, page, ids):
+    run_response(state, Task, "reset worklist")
+    command(state, Worklist, page)
+    command(state, Worklist, f"remove {ids}")
+    command(state, Worklist, "add new list")
+
+def test_another_users_tasks_dont_change_the_pages(state):
+    db.create_task("not in this worklist", worklist_id=WORKLISTS + 1)
+    command(state, Task, "add buy milk")
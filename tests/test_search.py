@@ -0,0 +1,88 @@
+from todolist import db
+from todolist.db import User, Worklist, Task
+
+
+def test_search_ranks_by_relevance(database):
+    db.create_user("Ada", "Lovelace")
+    db.create_worklist("Errands", user_id=1)
+    db.create_tasks_bulk(["buy bread and milk at the shop on the corner", "milk", "call mom", "milk milk the cow"],
+                         worklist_id=1)
+    assert [row.task for row in db.search_tasks(1, "milk")] == \
+        ["milk", "milk milk the cow", "buy bread and milk at the shop on the corner"]
+    assert [row.task for row in db.search_tasks(1, "mo")] == ["call mom"]
+
+def test_search_only_finds_the_users_tasks(database):
+    for name in ("Ada", "Alan"):
+        db.create_user(name, "Test")
+    db.create_worklist("Ada's", user_id=1)
+    db.create_worklist("Alan's", user_id=2)
+    db.create_task("milk", worklist_id=1)
+    db.create_task("milk", worklist_id=2)
+    assert [row.worklist_id for row in db.search_tasks(2, "milk")] == [2]
+
+def test_upgrade_puts_a_missing_trigger_back_and_indexes_what_it_missed(database):
+    db.create_user("Ada", "Lovelace")
+    db.create_worklist("Errands", user_id=1)
+    with db.engine.begin() as connection:
+        connection.exec_driver_sql("DROP TRIGGER task_search_insert")
+    db.create_task("milk", worklist_id=1)
+    assert db.search_tasks(1, "milk") == []
+    db.create_db_and_tables(keep_data=True)
+    assert [row.task for row in db.search_tasks(1, "milk")] == ["milk"]
+    db.create_task("bread", worklist_id=1)
+    assert [row.task for row in db.search_tasks(1, "bread")] == ["bread"]
+
+def test_an_old_match_ranks_above_many_newer_ones(database):
+    db.create_user("Ada", "Lovelace")
+    db.create_worklist("Errands", user_id=1)
+    db.create_task("milk", worklist_id=1)
+    db.create_tasks_bulk([f"milk and {number} other things to buy" for number in range(1500)], worklist_id=1)
+    assert db.search_tasks(1, "milk")[0].task == "milk"
+
+def indexed(connection):
+    """The terms in task_search, with the number of tasks that have them"""
+    connection.exec_driver_sql("CREATE VIRTUAL TABLE IF NOT EXISTS temp.search_vocab USING fts5vocab(main, task_search, row)")
+    return connection.exec_driver_sql("SELECT term, doc FROM search_vocab").all()
+
+def test_the_index_follows_every_change(database):
+    for name in ("Ada", "Alan"):
+        db.create_user(name, "Test")
+    db.create_worklists_bulk(["errands", "work", "garden"], user_id=1)
+    db.create_worklist("Alan's", user_id=2)
+    for worklist_id in (1, 2, 3, 4):
+        db.create_tasks_bulk(["buy milk", "call mom", "fix the bug, again!"], worklist_id=worklist_id)
+    task = db.get_entity(Task, 1)
+    task.task = "buy bread"
+    db.update_entity(task)
+    task = db.get_entity(Task, 2)
+    task.worklist_id = 4 # moved to Alan
+    db.update_entity(task)
+    worklist = db.get_entity(Worklist, 3)
+    worklist.user_id = 2
+    db.update_entity(worklist)
+    db.delete_tasks(2, [(4, 4)])
+    db.delete_worklists(1, [(1, 1)]) # its tasks go with it
+    db.delete_by_id(User, [2]) # its worklists and their tasks too
+    with db.engine.begin() as connection:
+        kept = indexed(connection)
+        db.create_search_index(connection, rebuild=True)
+        assert kept == indexed(connection)
+    # what is left is Ada's "call mom" and "fix the bug, again!" in worklist 2
+    assert kept == [("1xagain", 1), ("1xbug", 1), ("1xcall", 1), ("1xfix", 1), ("1xmom", 1), ("1xthe", 1)]
+
+def test_upgrade_replaces_the_old_search_index(database):
+    db.create_user("Ada", "Lovelace")
+    db.create_worklist("Errands", user_id=1)
+    db.create_task("milk", worklist_id=1)
+    with db.engine.begin() as connection:
+        for name in db.SEARCH_INDEX_NAMES[1:]:
+            connection.exec_driver_sql(f"DROP TRIGGER {name}")
+        connection.exec_driver_sql("DROP TABLE task_search")
+        connection.exec_driver_sql("CREATE VIRTUAL TABLE task_fts USING fts5(task, content='task', content_rowid='id')")
+        connection.exec_driver_sql("CREATE TRIGGER task_fts_insert AFTER INSERT ON task BEGIN "
+                                   "INSERT INTO task_fts(rowid, task) VALUES (new.id, new.task); END")
+    db.create_db_and_tables(keep_data=True)
+    with db.engine.connect() as connection:
+        assert db.has_search_index(connection)
+        assert not connection.exec_driver_sql("SELECT name FROM sqlite_master WHERE name LIKE 'task_fts%'").all()
+    assert [row.task for row in db.search_tasks(1, "milk")] == ["milk"]
@@ -0,0 +1,122 @@
+import json
+import multiprocessing
+import os
+from datetime import date
+
+import pytest
+from click.testing import CliRunner
+
+from todolist import db
+from todolist.transfer import TABLES, export_cli, import_cli, import_records
+
+
+def fill(prefix:str):
+    """Two users, three worklists and a few tasks, named after prefix"""
+    for name in ("Ada", "Alan"):
+        db.create_user(f"{prefix} {name}", "Test")
+    users = [user.id for user in db.get_users() if user.first_name.startswith(prefix)]
+    worklists = db.create_worklists_bulk([dict(name=f"{prefix} errands", date_created=date(2024, 1, 2)),
+                                          dict(name=f"{prefix} work", date_created=date(2024, 1, 3))], user_id=users[0])
+    worklists += db.create_worklists_bulk([f"{prefix} garden"], user_id=users[1])
+    for worklist_id in worklists:
+        db.create_tasks_bulk([dict(task=f"{prefix} task {number} of {worklist_id}", date_created=date(2024, 2, number),
+                                   completed=number == 2) for number in (1, 2, 3)], worklist_id=worklist_id)
+
+def export(path, *args):
+    result = CliRunner().invoke(export_cli, [str(path), *args])
+    assert result.exit_code == 0, result.output
+
+def use_new_database(path):
+    db.configure(db_path=path)
+    db.SQLModel.metadata.create_all(db.engine)
+
+def tasks_by_owner():
+    """Every task with the names of its worklist and user, what an import has to keep whatever the ids"""
+    with db.engine.connect() as connection:
+        return sorted(connection.exec_driver_sql(
+            "SELECT user.first_name, worklist.name, worklist.date_created, task.task, task.date_created, task.completed "
+            "FROM task JOIN worklist ON worklist.id = task.worklist_id JOIN user ON user.id = worklist.user_id").all())
+
+@pytest.mark.parametrize("format_", ["jsonl", "csv"])
+def test_round_trip(database, tmp_path, format_):
+    fill("old")
+    export(tmp_path / "first", "--format", format_)
+    use_new_database(tmp_path / "copy.db")
+    result = CliRunner().invoke(import_cli, [str(tmp_path / "first"), "--format", format_])
+    assert result.exit_code == 0, result.output
+    # the indexes dropped while importing into the empty tables are back
+    with db.engine.connect() as connection:
+        names = set(connection.exec_driver_sql("SELECT name FROM sqlite_master WHERE type = 'index'").scalars())
+    assert {index.name for table in TABLES for index in table.indexes} <= names
+    export(tmp_path / "second", "--format", format_)
+    if format_ == "jsonl":
+        assert (tmp_path / "first").read_text() == (tmp_path / "second").read_text()
+    else:
+        for table in ("user", "worklist", "task"):
+            assert (tmp_path / "first" / f"{table}.csv").read_text() == (tmp_path / "second" / f"{table}.csv").read_text()
+
+def test_import_into_a_database_with_data(database, tmp_path):
+    fill("old")
+    export(tmp_path / "backup.jsonl")
+    imported = tasks_by_owner()
+    use_new_database(tmp_path / "other.db")
+    fill("new")
+    existing = tasks_by_owner()
+    result = CliRunner().invoke(import_cli, [str(tmp_path / "backup.jsonl")])
+    assert result.exit_code == 0, result.output
+    # the ids moved past the existing ones, and the rows still point to the right parents
+    assert tasks_by_owner() == sorted(existing + imported)
+    assert [user.first_name for user in db.get_users()] == ["new Ada", "new Alan", "old Ada", "old Alan"]
+    # the imported tasks are in the search index, and the insert trigger is back for the next ones
+    old_ada = db.get_users()[2].id
+    assert len(db.search_tasks(old_ada, "old task")) == 6
+    with db.engine.connect() as connection:
+        assert db.has_search_index(connection)
+    worklist_id = db.get_worklists(old_ada)[0].id
+    db.create_task("after the import", worklist_id=worklist_id)
+    assert [row.task for row in db.search_tasks(old_ada, "after")] == ["after the import"]
+
+def test_import_into_a_database_without_the_search_index(database, tmp_path):
+    fill("old")
+    export(tmp_path / "backup.jsonl")
+    use_new_database(tmp_path / "not upgraded.db")
+    with db.engine.begin() as connection:
+        connection.exec_driver_sql("DROP TABLE task_search") # as before the search index existed
+    result = CliRunner().invoke(import_cli, [str(tmp_path / "backup.jsonl")])
+    assert result.exit_code == 0, result.output
+    with db.engine.connect() as connection:
+        assert db.has_search_index(connection)
+    assert len(db.search_tasks(db.get_users()[0].id, "old task")) == 6
+
+def test_a_failed_import_changes_nothing(database, tmp_path):
+    fill("new")
+    before = tasks_by_owner()
+    lines = [dict(table="user", id=1, first_name="old Ada", last_name="Test"),
+             dict(table="worklist", id=1, user_id=1, name="old errands", date_created="2024-01-02"),
+             dict(table="task", id=1, worklist_id=1, task="fine", date_created="2024-02-01", completed=False),
+             dict(table="task", id=2, worklist_id=1, task=None, date_created="2024-02-01", completed=False)]
+    (tmp_path / "bad.jsonl").write_text("".join(json.dumps(line) + "\n" for line in lines))
+    result = CliRunner().invoke(import_cli, [str(tmp_path / "bad.jsonl")])
+    assert result.exit_code == 1 and "Nothing imported" in result.output
+    assert tasks_by_owner() == before
+    # the insert trigger was dropped in the transaction that was rolled back
+    with db.engine.connect() as connection:
+        assert db.has_search_index(connection)
+
+def _die_while_importing(db_path):
+    db.configure(db_path=db_path)
+    def records():
+        yield "user", dict(id=1, first_name="old Ada", last_name="Test")
+        os._exit(1) # no rollback, no finally: what sqlite has on disk is all there is
+    with db.engine.connect() as connection:
+        import_records(connection, records())
+
+def test_an_import_killed_halfway_keeps_the_trigger(database):
+    fill("new")
+    process = multiprocessing.get_context("spawn").Process(target=_die_while_importing, args=(database,))
+    process.start()
+    process.join(timeout=60)
+    assert process.exitcode == 1
+    with db.engine.connect() as connection:
+        assert db.has_search_index(connection)
+    assert [user.first_name for user in db.get_users()] == ["new Ada", "new Alan"]